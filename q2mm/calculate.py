@@ -19,17 +19,21 @@ from __future__ import division
 import argparse
 import logging
 import logging.config
+import multiprocessing
 import numpy as np
 import os
 import sys
+import threading
 
+from collections import defaultdict, OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 # I don't really want to import all of chain if possible. I only want
 # chain.from_iterable.
 # chain.from_iterable flattens a list of lists similar to:
 #   [child for parent in grandparent for child in parent]
 # However, I think chain.from_iterable works on any number of nested lists.
 from itertools import chain
-from textwrap import TextWrapper
 
 import constants as co
 import compare
@@ -39,39 +43,76 @@ import parameters
 
 logger = logging.getLogger(__name__)
 
+# Commands are stored as frozensets so that checking whether a command belongs
+# to a particular group is a single lookup.
 # Commands where we need to load the force field.
-COM_LOAD_FF    = ['ma', 'mb', 'mt',
-                  'ja', 'jb', 'jt']
+COM_LOAD_FF    = frozenset(['ma', 'mb', 'mt',
+                            'ja', 'jb', 'jt'])
 # Commands related to Gaussian.
-COM_GAUSSIAN   = ['gaa','gaao','gab','gabo','gat','gato',
-                  'gta','gtb','gtt','ge','ge1', 'gea', 'geo','ge1o', 'geao',
-                  'gh', 'geigz']
+COM_GAUSSIAN   = frozenset(['gaa','gaao','gab','gabo','gat','gato',
+                            'gta','gtb','gtt','ge','ge1', 'gea', 'geo',
+                            'ge1o', 'geao', 'gh', 'geigz'])
+# Gaussian commands that use Tinker.
+COM_GAUSSIAN_TINKER = frozenset(['gta','gtb','gtt'])
+# Gaussian commands that use Amber.
+COM_GAUSSIAN_AMBER  = frozenset(['gaa','gab','gat','gaao','gabo','gato'])
 # Commands related to Jaguar (Schrodinger).
-COM_JAGUAR     = ['jq', 'jqh', 'jqa',
-                  'je', 'jeo', 'jea', 'jeao',
-                  'jh', 'jeigz']
+COM_JAGUAR     = frozenset(['jq', 'jqh', 'jqa',
+                            'je', 'jeo', 'jea', 'jeao',
+                            'jh', 'jeigz'])
 # Commands related to MacroModel (Schrodinger).
 # Seems odd that the Jaguar geometry datatypes are in here, but we
 # do a MacroModel calculation to get the data in an easy form to
 # extract.
-COM_MACROMODEL = ['ja', 'jb', 'jt',
-                  'mq', 'mqh', 'mqa',
-                  'ma', 'mb', 'mt',
-                  'me', 'meo', 'mea', 'meao',
-                  'mh', 'mjeig', 'mgeig',
-                  'mp', 'mgESP', 'mjESP']
+COM_MACROMODEL = frozenset(['ja', 'jb', 'jt',
+                            'mq', 'mqh', 'mqa',
+                            'ma', 'mb', 'mt',
+                            'me', 'meo', 'mea', 'meao',
+                            'mh', 'mjeig', 'mgeig',
+                            'mp', 'mgESP', 'mjESP'])
 # Commands related to Tinker.
-COM_TINKER     = ['ta','tao', 'tb', 'tbo',
-                  'tt','tto', 'te', 'teo',
-                  'tea','teao', 'th',
-                  'tjeigz', 'tgeig']
+COM_TINKER     = frozenset(['ta','tao', 'tb', 'tbo',
+                            'tt','tto', 'te', 'teo',
+                            'tea','teao', 'th',
+                            'tjeigz', 'tgeig'])
+# Tinker energy commands.
+COM_TINKER_ENERGY = frozenset(['te','teo','tea','teao'])
 # Commands related to Amber.
-COM_AMBER      = ['ae','ae1','aeo','ae1o','abo','aao','ato','ah']
+COM_AMBER      = frozenset(['ae','ae1','aeo','ae1o','abo','aao','ato','ah'])
+# Amber energy commands.
+COM_AMBER_ENERGY  = frozenset(['ae','aeo','aea','aeao','ae1','ae1o'])
+# Energy commands that use the structures from before the optimization.
+COM_ENERGY_PRE = frozenset(['me', 'mea', 'te', 'tea', 'ae1'])
+# Energy data types set relative to the average energy of their group.
+TYP_ENERGY_AVG = frozenset(['ea', 'eao'])
+# Energy data types set relative to the lowest energy of their group.
+TYP_ENERGY_MIN = frozenset(['e', 'eo'])
 # All other commands.
-COM_OTHER = ['r']                           
+COM_OTHER = frozenset(['r'])
+# Commands whose backends change the working directory while they run.
+COM_CHANGE_DIR = COM_TINKER | COM_GAUSSIAN_TINKER | COM_AMBER | \
+                 COM_GAUSSIAN_AMBER
 # All possible commands.
-COM_ALL = COM_GAUSSIAN + COM_JAGUAR + COM_MACROMODEL + COM_TINKER + \
-          COM_AMBER + COM_OTHER
+COM_ALL = COM_GAUSSIAN | COM_JAGUAR | COM_MACROMODEL | COM_TINKER | \
+          COM_AMBER | COM_OTHER
+# Lower triangle indices already generated by low_tri_indices(), keyed by the
+# size of the matrix.
+LOW_TRI_IDX = {}
+# Classes used to write and run the backend calculations. The first group of
+# commands that matches any command requested for a file is used, then the
+# class is picked using the file's extension. Files that don't match any of
+# these groups don't need a backend calculation. Support for a new format is
+# added by registering its class here.
+INPUT_CLASSES = OrderedDict([
+    (COM_MACROMODEL, {'.mae': filetypes.Mae}),
+    (COM_TINKER, {'.xyz': filetypes.TinkerXYZ}),
+    # For bond, angle, torsion taken from Gaussian. The xyz will be
+    # collected from Gaussian and be rewritten in the corresponding
+    # software.
+    (COM_GAUSSIAN_TINKER, {'.log': filetypes.TinkerXYZ_FOR_GAUS}),
+    (COM_GAUSSIAN_AMBER, {'.log': filetypes.AmberLeap_Gaus}),
+    # leap.in as for now.
+    (COM_AMBER, {'.in': filetypes.AmberLeap})])
 
 def main(args):
     """
@@ -82,14 +123,8 @@ def main(args):
            it's a string, it will be converted into a list of strings.
     """
     # Should be a list of strings for use by argparse. Ensure that's the case.
-    # basestring is deprecated in python3, str is probably safe to use in both
-    # but should be tested, for now sys.version_info switch can handle it
-    if sys.version_info > (3, 0):
-        if isinstance(args, str):
-            args = args.split()
-    else:
-        if isinstance(args, basestring):
-            args = args.split()
+    if isinstance(args, str):
+        args = args.split()
     parser = return_calculate_parser()
     opts = parser.parse_args(args)
     # This makes a dictionary that only contains the arguments related to
@@ -108,7 +143,7 @@ def main(args):
                 in COM_ALL and value}
     # Add in the empty commands. I'd rather not do this, but it makes later
     # coding when collecting data easier.
-    for command in COM_ALL:
+    for command in sorted(COM_ALL):
         if command not in commands:
             commands.update({command: []})
     pretty_all_commands(commands)
@@ -141,24 +176,44 @@ def main(args):
     #  'b2.01.mae': <__main__.Mae object at 0x1353e11>,
     # }
     inps = {}
-    # This generates any of the necessary command files. It uses
-    # commands_for_filenames, which contains all of the data types associated
-    # with the given file.
-    # Stuff below doesn't need both comma separated filenames simultaneously.
-    for filename, commands_for_filename in commands_for_filenames.items():
-        logger.log(1, '>>> filename: {}'.format(filename))
-        logger.log(1, '>>> commands_for_filename: {}'.format(
-            commands_for_filename))
-        # These next two if statements will break down what command files
-        # have to be written by the backend software package.
-        if any(x in COM_MACROMODEL for x in commands_for_filename):
-            if os.path.splitext(filename)[1] == '.mae':
-                inps[filename] = filetypes.Mae(
+    # MacroModel command files still waiting to be written.
+    mae_coms = []
+    # Ex. reference data (-r) or data read straight from Gaussian or Jaguar
+    # output files don't need any backend command files, so every file can
+    # be skipped at once.
+    requested = [com for com, groups in commands.items() if groups]
+    needs_backend = any(
+        not com_group.isdisjoint(requested) for com_group in INPUT_CLASSES)
+    if needs_backend:
+        # This generates any of the necessary command files. It uses
+        # commands_for_filenames, which contains all of the data types
+        # associated with the given file.
+        # Stuff below doesn't need both comma separated filenames
+        # simultaneously.
+        for filename, commands_for_filename in commands_for_filenames.items():
+            logger.log(1, '>>> filename: {}'.format(filename))
+            logger.log(1, '>>> commands_for_filename: {}'.format(
+                commands_for_filename))
+            # Find the group of commands, and from that the backend software
+            # package, that will write the command files for this file.
+            for com_group, input_classes in INPUT_CLASSES.items():
+                if not com_group.isdisjoint(commands_for_filename):
+                    break
+            else:
+                # In this case, no command files have to be written.
+                inps[filename] = None
+                continue
+            ext = os.path.splitext(filename)[1]
+            input_class = input_classes.get(ext)
+            if input_class is not None:
+                inps[filename] = input_class(
                     os.path.join(opts.directory, filename))
                 inps[filename].commands = commands_for_filename
-                inps[filename].write_com(sometext=opts.append)
+                if input_class is filetypes.Mae:
+                    # Written all at once below.
+                    mae_coms.append(inps[filename])
             #Has to be here even though this is a Gaussian Job.
-            if os.path.splitext(filename)[1] == '.chk':
+            elif com_group is COM_MACROMODEL and ext == '.chk':
                 # The generated com file will be used as the input filename. It
                 # also seems best to do the gaussian calculation in the 
                 # collect_data function since we need to collect the force 
@@ -168,43 +223,16 @@ def main(args):
                     os.path.join(opts.directory, com_filename))
                 inps[com_filename].commands = commands_for_filename
                 inps[com_filename].read_newzmat(filename)
-                
-
-        elif any(x in COM_TINKER for x in commands_for_filename):
-            if os.path.splitext(filename)[1] == '.xyz':
-                inps[filename] = filetypes.TinkerXYZ(
-                    os.path.join(opts.directory, filename))
-                inps[filename].commands = commands_for_filename
-        # Gaussian to Tinker
-        elif any(x in ['gta','gtb','gtt'] for x in commands_for_filename):
-            # For bond, angle, torsion taken from Gaussian
-            # The xyz will be collected from Gaussian and be rewritten in corresponding software
-            # 
-            # Q2MM takes commands_for_filename for each line of RDAT and CDAT
-            # must make difference type
-            # Tinker
-            if os.path.splitext(filename)[1] == ".log":
-                inps[filename] = filetypes.TinkerXYZ_FOR_GAUS(
-                    os.path.join(opts.directory, filename))
-                inps[filename].commands = commands_for_filename
-        # Gausssian to Amber
-        elif any(x in ['gaa','gab','gat','gaao','gabo','gato'] for x in commands_for_filename):
-            if os.path.splitext(filename)[1] == ".log":
-                inps[filename] = filetypes.AmberLeap_Gaus(
-                    os.path.join(opts.directory, filename))
-                inps[filename].commands = commands_for_filename
-                    
-        elif any(x in COM_AMBER for x in commands_for_filename):
-            if os.path.splitext(filename)[1] == ".in": # leap.in as for now
-                inps[filename] = filetypes.AmberLeap(os.path.join(opts.directory, filename))
-                inps[filename].commands = commands_for_filename
-            # This doesn't work.
-            # We need to know both filenames simultaneously for this Amber crap.
-            # Have to add these to `inps` in some other way.
-            # pass
-        # In this case, no command files have to be written.
-        else:
-            inps[filename] = None
+            # Amber inputs that need both comma separated filenames don't
+            # work here. We need to know both filenames simultaneously for
+            # this Amber crap. Have to add these to `inps` in some other way.
+    else:
+        logger.log(5, '  -- No backend command files needed.')
+        inps = dict.fromkeys(commands_for_filenames)
+    # Only has anything to write if MacroModel commands were requested. The
+    # .com files are still written with --norun, so that they can be run
+    # separately.
+    write_macromodel_coms(mae_coms, sometext=opts.append)
     # Stuff below needs both comma separated filenames simultaneously.
     # Do the Amber inputs.
     # Leaving the filenames together because Taylor said this would work well.
@@ -221,15 +249,23 @@ def main(args):
     if opts.norun or opts.fake:
         logger.log(15, "  -- Skipping backend calculations.")
     else:
+        # MacroModel calculations are independent of one another, so they're
+        # gathered up and run together below. The other backends share
+        # scratch files (ex. Amber's calc directory) and run one at a time.
+        maes = []
         for filename, some_class in inps.items():
             logger.log(1, '>>> filename: {}'.format(filename))
             logger.log(1, '>>> some_class: {}'.format(some_class))
+            if isinstance(some_class, filetypes.Mae):
+                maes.append(some_class)
             # Works if some class is None too.
-            if hasattr(some_class, 'run'):
+            elif hasattr(some_class, 'run'):
                 # Ideally this can be the same for each software backend,
                 # but that means we're going to have to make some changes
                 # so that this token argument is handled properly.
                 some_class.run(check_tokens=opts.check)
+        run_macromodel(
+            maes, check_tokens=opts.check, max_tokens=opts.max_tokens)
     # `data` is a list comprised of datatypes.Datum objects.
     # If we remove/with sorting removed, the Datum class is less
     # useful. We may want to reduce this to a N x 3 matrix or
@@ -303,6 +339,12 @@ def return_calculate_parser(add_help=True, parents=None):
         help=("This option will invert the smallest eigenvalue to be whatever "
               "value is specified by this argument whenever a Hessian is "
               "read."))
+    opts.add_argument(
+        '--max-tokens', type=int, metavar='someint', default=1,
+        dest='max_tokens',
+        help=("Maximum number of MacroModel calculations run at the same "
+              "time. Each calculation uses its own Schrodinger license "
+              "tokens. Default is 1."))
     opts.add_argument(
         '--nocheck', '-nc', action='store_false', dest='check', default=True,
         help=("By default, Q2MM checks whether MacroModel tokens are "
@@ -635,11 +677,68 @@ def return_calculate_parser(add_help=True, parents=None):
         help='Amber Hessian (post-FF optimization).')
     return parser
 
+def write_macromodel_coms(maes, sometext=None, max_workers=4):
+    """
+    Writes the MacroModel .com files for several .mae files.
+
+    Writing the files is mostly disk I/O, so they're written using threads.
+    All of them are finished before this returns.
+
+    Arguments
+    ---------
+    maes : list of filetypes.Mae
+    sometext : string or None
+               Additional text added to the .com filenames.
+    max_workers : int
+                  Maximum number of files written at the same time.
+    """
+    if len(maes) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(mae.write_com, sometext=sometext)
+                       for mae in maes]
+            # Raises any exception from writing the files.
+            for future in futures:
+                future.result()
+    else:
+        for mae in maes:
+            mae.write_com(sometext=sometext)
+
+def run_macromodel(maes, check_tokens=True, max_tokens=1):
+    """
+    Runs the MacroModel command files for several .mae files.
+
+    Each calculation spends most of its time waiting on the MacroModel
+    subprocess, so up to max_tokens of them are run at once using threads.
+
+    Arguments
+    ---------
+    maes : list of filetypes.Mae
+    check_tokens : bool
+                   Whether to check for available Schrodinger tokens before
+                   each calculation.
+    max_tokens : int
+                 Maximum number of calculations run at the same time.
+    """
+    if max_tokens > 1 and len(maes) > 1:
+        with ThreadPoolExecutor(max_workers=max_tokens) as executor:
+            futures = [executor.submit(mae.run, check_tokens=check_tokens)
+                       for mae in maes]
+            # Raises any exception from the calculations.
+            for future in futures:
+                future.result()
+    else:
+        for mae in maes:
+            mae.run(check_tokens=check_tokens)
+
 def check_outs(filename, outs, classtype, direc):
     """
     Reads a file if necessary. Checks the output dictionary first in
     case the file has already been loaded.
 
+    Files are stored using their absolute path and class, so the same file
+    is never read twice even if it's referred to using different relative
+    paths (ex. 'a1.01.mae' and './a1.01.mae').
+
     Could work on easing the use of this by somehow reducing number of
     arguments required.
     """
@@ -647,10 +746,133 @@ def check_outs(filename, outs, classtype, direc):
     logger.log(1, '>>> outs: {}'.format(outs))
     logger.log(1, '>>> classtype: {}'.format(classtype))
     logger.log(1, '>>> direc: {}'.format(direc))
-    if filename not in outs:
-        outs[filename] = \
-            classtype(os.path.join(direc, filename))
-    return outs[filename]
+    key = (os.path.abspath(os.path.join(direc, filename)), classtype)
+    if key not in outs:
+        outs[key] = classtype(key[0])
+    return outs[key]
+
+def low_tri_indices(num):
+    """
+    Returns the indices of the lower triangle of a num x num matrix, like
+    np.tril_indices(num). Every file of a given system has Hessians and
+    eigenmatrices of the same size, so the indices are only generated once
+    for each size.
+
+    The returned arrays are shared between calls and are read-only. Copy
+    them before modifying.
+
+    Arguments
+    ---------
+    num : int
+
+    Returns
+    -------
+    tuple of 2 np.ndarray
+    """
+    if num not in LOW_TRI_IDX:
+        low_tri_idx = np.tril_indices(num)
+        for idx in low_tri_idx:
+            idx.setflags(write=False)
+        LOW_TRI_IDX[num] = low_tri_idx
+    return LOW_TRI_IDX[num]
+
+def make_eig_data(matrix, com, src_1, src_2=None, diag_only=False):
+    """
+    Makes a Datum for every element in the lower triangle of an eigenmatrix.
+
+    Arguments
+    ---------
+    matrix : np.ndarray
+             The eigenmatrix, or only its diagonal if diag_only is True.
+    com : string
+    src_1 : string
+    src_2 : string or None
+    diag_only : bool
+                If True, matrix is a 1D array of the diagonal elements. The
+                off-diagonal elements are still returned as zeros so that
+                these data points stay aligned with full eigenmatrices
+                (ex. -mjeig) when they're compared.
+
+    Returns
+    -------
+    list of Datum
+    """
+    if diag_only:
+        num = len(matrix)
+    else:
+        num = matrix.shape[0]
+    low_tri_idx = low_tri_indices(num)
+    if diag_only:
+        low_tri = np.zeros(len(low_tri_idx[0]))
+        # Element (i, i) sits at i * (i + 3) / 2 in the row-major lower
+        # triangle, so there's no need to build the full matrix.
+        diag_idx = np.arange(num)
+        low_tri[diag_idx * (diag_idx + 3) // 2] = matrix
+    else:
+        low_tri = matrix[low_tri_idx]
+    # Converting to lists up front avoids making a numpy scalar for every
+    # element.
+    return [datatypes.Datum(
+                val=e,
+                com=com,
+                typ='eig',
+                src_1=src_1,
+                src_2=src_2,
+                idx_1=x,
+                idx_2=y)
+            for e, x, y in zip(
+                low_tri.tolist(),
+                (low_tri_idx[0] + 1).tolist(),
+                (low_tri_idx[1] + 1).tolist())]
+
+def make_charge_data(
+    structure, com, typ, src_1, idx_1, exclude=None, folds=None):
+    """
+    Makes the partial charge data for a single structure.
+
+    Atoms whose b_q_use_charge property is 0 are skipped. If an atom doesn't
+    have that property, its charge is used.
+
+    Arguments
+    ---------
+    structure : filetypes.Structure
+    com : string
+          Command for the data (ex. jq).
+    typ : string
+          Data type (ex. q).
+    src_1 : string
+            Filename the data came from.
+    idx_1 : int
+            Index of the structure in that file, starting at 1.
+    exclude : set of filetypes.Atom or None
+              Atoms whose charges are skipped.
+    folds : list of tuples of (int, int) or None
+            Pairs of atom positions in structure.atoms, starting at 0. The
+            charge of the 2nd atom in each pair is added onto the 1st.
+
+    Returns
+    -------
+    list of datatypes.Datum
+    """
+    charges = structure.partial_charges
+    if folds:
+        idx_to, idx_from = zip(*folds)
+        np.add.at(charges, list(idx_to), charges[list(idx_from)])
+    use = [i for i, atom in enumerate(structure.atoms)
+           if (not 'b_q_use_charge' in atom.props or
+               atom.props['b_q_use_charge']) and
+           not (exclude and atom in exclude)]
+    return [datatypes.Datum(
+                val=val, com=com, typ=typ, src_1=src_1, idx_1=idx_1,
+                atm_1=structure.atoms[i].index)
+            for i, val in zip(use, charges[use].tolist())]
+
+def is_single_bonded_hyd(atom, hyds):
+    """
+    Checks whether an atom is one of the hydrogens in hyds with fewer than
+    two bonds.
+    """
+    return atom in hyds and len(atom.bonded_atom_indices) < 2
 
 def collect_reference(path):
     """
@@ -661,14 +883,12 @@ def collect_reference(path):
       2. Weights
       3. Values
     """
-    data = []
+    rows = []
     with open(path, 'r') as f:
         for i, line in enumerate(f):
             # Skip certain lines.
             if line[0] in ['-', '#']:
                 continue
-            # if line.startswith('-'):
-            #     continue
             # Remove everything following a # in a line.
             line = line.partition('#')[0]
             cols = line.split()
@@ -676,146 +896,251 @@ def collect_reference(path):
             assert len(cols) == 3, \
                 'Error reading line {} from {}: {}'.format(
                 i, path, line)
-            lbl, wht, val = cols
-            datum = datatypes.Datum(lbl=lbl, wht=float(wht), val=float(val))
-            # Added this from the function below, read_reference()
-            lbl_to_data_attrs(datum, lbl)
-            data.append(datum)
+            rows.append(cols)
+    if not rows:
+        return np.array([])
+    # NumPy converts the weights and values for the whole file at once
+    # rather than calling float() on each.
+    lbls, whts, vals = zip(*rows)
+    data = [datatypes.Datum(lbl=lbl, wht=wht, val=val)
+            for lbl, wht, val in zip(
+                lbls,
+                np.array(whts, dtype=float).tolist(),
+                np.array(vals, dtype=float).tolist())]
+    for datum in data:
+        # Added this from the function below, read_reference()
+        lbl_to_data_attrs(datum, datum.lbl)
     return np.array(data)
 
-# Must be rewritten to go in a particular order of data types every time.
 def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
     """
+    Collects all of the data requested in coms.
+
+    Each command is handled by the function given for it in COLLECTORS.
+    Commands are always handled in the order of COLLECTORS so that the
+    calculated and reference data points align properly.
+
     Arguments
     ---------
+    coms : dic
+           Keys are commands and values are lists of lists of filenames.
+    inps : dic
+           Keys are filenames and values are the filetype classes used to
+           run the backend software (or None).
     invert : None or float
              If given, will modify the smallest value of the Hessian to
              this value.
     """
     # outs looks like:
-    # {'filename1': <some class for filename1>,
-    #  'filename2': <some class for filename2>,
-    #  'filename3': <some class for filename3>
+    # {('/path/filename1', SomeClass): <some class for filename1>,
+    #  ('/path/filename2', SomeClass): <some class for filename2>,
+    #  ('/path/filename3', OtherClass): <other class for filename3>
     # }
     outs = {}
+    # The .mae files used to write MacroModel command files have already been
+    # loaded (and likely read) inside main, so reuse them.
+    for inp in inps.values():
+        if isinstance(inp, filetypes.Mae):
+            outs[(inp.path, filetypes.Mae)] = inp
+    prefetch_gaussian_logs(coms, outs, direc)
     # List of Datum objects.
     data = []
-    # REFERENCE DATA TEXT FILES
+    for com, collector in COLLECTORS.items():
+        groups = coms.get(com)
+        if groups:
+            data.extend(collector(
+                com, groups, inps, outs, direc, sub_names, invert))
+    logger.log(15, 'TOTAL DATA POINTS: {}'.format(len(data)))
+    return np.array(data, dtype=datatypes.Datum)
+
+# Commands that use the force constants or eigenvectors from Gaussian .log
+# files. The values are the position of the .log file in each comma separated
+# group of filenames.
+COM_GAUSSIAN_FREQS = {'geigz': 0, 'mgeig': 1, 'tgeig': 1}
+
+def read_gaussian_freqs(path):
+    """
+    Reads the force constants and eigenvectors from a Gaussian .log file.
+
+    This is run in the worker processes used by prefetch_gaussian_logs, so
+    only the path and arrays are returned rather than the GaussLog itself.
+    """
+    log = filetypes.GaussLog(path)
+    return path, log.evals, log.evecs
+
+def prefetch_gaussian_logs(coms, outs, direc, processes=None):
+    """
+    Reads the Gaussian .log files used for their force constants or
+    eigenvectors, putting them in outs.
+
+    Parsing these files is slow and each one is independent of the others,
+    so they're read in parallel using a pool of processes. Files that have
+    an up to date cache (see filetypes.load_cache) are loaded from it
+    directly.
+
+    Arguments
+    ---------
+    coms : dic
+           Keys are commands and values are lists of lists of filenames.
+    outs : dic
+           Keys are tuples of the absolute path and class for each file.
+    processes : int or None
+                Maximum number of processes. If None, uses the number of
+                CPUs. Never more than the number of files to read.
+    """
+    paths = set()
+    for com, position in COM_GAUSSIAN_FREQS.items():
+        for comma_sep_filenames in chain.from_iterable(coms.get(com, [])):
+            filename = comma_sep_filenames.split(',')[position]
+            path = os.path.abspath(os.path.join(direc, filename))
+            if (path, filetypes.GaussLog) not in outs:
+                paths.add(path)
+    to_parse = []
+    for path in sorted(paths):
+        cached = filetypes.load_cache(path, ['evals', 'evecs'])
+        if cached is None:
+            to_parse.append(path)
+        else:
+            log = filetypes.GaussLog(path)
+            log.set_freqs(cached['evals'], cached['evecs'])
+            outs[(path, filetypes.GaussLog)] = log
+    if processes is None:
+        processes = os.cpu_count() or 1
+    # No more processes than there are files to read.
+    processes = min(len(to_parse), processes)
+    # With only one process (ex. a single file), the files are read as needed
+    # by the collectors instead.
+    if processes < 2:
+        return
+    # Forking while other threads are running (ex. RDAT in loop) could copy
+    # locks they hold into the workers, so fresh processes are spawned
+    # instead.
+    if threading.active_count() > 1:
+        context = multiprocessing.get_context('spawn')
+    else:
+        context = multiprocessing.get_context()
+    logger.log(5, '  -- Reading {} Gaussian .log files in parallel.'.format(
+        len(to_parse)))
+    with context.Pool(processes=processes) as pool:
+        for path, evals, evecs in pool.imap_unordered(
+                read_gaussian_freqs, to_parse):
+            log = filetypes.GaussLog(path)
+            log.set_freqs(evals, evecs)
+            outs[(path, filetypes.GaussLog)] = log
+
+# Data types for the energy commands. The data type also determines what the
+# energies are set relative to (see shift_energies).
+ENERGY_TYPS = {
+    'je': 'e', 'jea': 'ea', 'jeo': 'eo', 'jeao': 'eao',
+    'ge': 'e', 'gea': 'ea', 'geo': 'eo', 'geao': 'eao',
+    'ge1': 'e1', 'ge1o': 'e1o',
+    'me': 'e', 'mea': 'ea', 'meo': 'eo', 'meao': 'eao',
+    'te': 'e', 'tea': 'ea', 'teo': 'eo', 'teao': 'eao',
+    'ae1': 'e1', 'ae1o': 'e1o'}
+
+def shift_energies(data, typ):
+    """
+    Sets a group of energies relative to the average energy for the
+    average data types ('ea' and 'eao'), or relative to the lowest energy
+    for 'e' and 'eo'. Other data types are left alone.
+
+    Arguments
+    ---------
+    data : list of Datum
+    typ : string
+    """
+    if typ in TYP_ENERGY_AVG:
+        zero = sum([x.val for x in data]) / len(data)
+    elif typ in TYP_ENERGY_MIN:
+        zero = min([x.val for x in data])
+    else:
+        return
+    for datum in data:
+        datum.val -= zero
+
+def collect_reference_files(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Reference data text files (-r).
+    """
+    data = []
     # No grouping is necessary for this data type, so flatten the list of
     # lists.
-    filenames = chain.from_iterable(coms['r'])
-    for filename in filenames:
+    for filename in chain.from_iterable(groups):
         # Unlike most datatypes, these Datum only get the attributes _lbl,
         # val and wht. This is to ensure that making and working with these
         # reference text files isn't too cumbersome.
         data.extend(collect_reference(os.path.join(direc, filename)))
-    # MACROMODEL MM3* CURRENT PARAMETER VALUES
-    filenames = chain.from_iterable(coms['mp'])
-    for comma_filenames in filenames:
+    return data
+
+def collect_mm3_params(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel MM3* current parameter values (-mp).
+    """
+    data = []
+    for comma_filenames in chain.from_iterable(groups):
         # FF file and parameter file.
         name_fld, name_txt = comma_filenames.split(',')
         ff = datatypes.MM3(os.path.join(direc, name_fld))
         ff.import_ff()
         ff.params = parameters.trim_params_by_file(
             ff.params, os.path.join(direc, name_txt))
-        for param in ff.params:
-            data.extend([datatypes.Datum(
-                val=param.value,
-                com='mp',
-                typ='p',
-                src_1=name_fld,
-                src_2=name_txt,
-                idx_1=param.mm3_row,
-                idx_2=param.mm3_col)])
-    # JAGUAR ENERGIES
-    filenames_s = coms['je']
+        data.extend([datatypes.Datum(
+                    val=param.value,
+                    com=com,
+                    typ='p',
+                    src_1=name_fld,
+                    src_2=name_txt,
+                    idx_1=param.mm3_row,
+                    idx_2=param.mm3_col)
+                     for param in ff.params])
+    return data
+
+def jaguar_energy(structure):
+    """
+    Returns the Jaguar energy (Hartree) stored on a structure.
+    """
+    try:
+        return structure.props['r_j_Gas_Phase_Energy']
+    except KeyError:
+        return structure.props['r_j_QM_Energy']
+
+def collect_jaguar_energies(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Jaguar energies (-je, -jea, -jeo, -jeao).
+    """
+    data = []
+    typ = ENERGY_TYPS[com]
     # idx_1 is the number used to group sets of relative energies.
-    for idx_1, filenames in enumerate(filenames_s):
+    for idx_1, filenames in enumerate(groups):
         temp = []
         for filename in filenames:
             mae = check_outs(filename, outs, filetypes.Mae, direc)
             # idx_2 corresponds to the structure inside the file in case the
             # .mae files contains multiple structures.
-            for idx_2, structure in enumerate(mae.structures):
-                try:
-                    energy = structure.props['r_j_Gas_Phase_Energy']
-                except KeyError:
-                    energy = structure.props['r_j_QM_Energy']
-                energy *= co.HARTREE_TO_KJMOL
-                temp.append(datatypes.Datum(
-                        val=energy,
-                        com='je',
-                        typ='e',
+            temp.extend([datatypes.Datum(
+                        val=jaguar_energy(structure) * co.HARTREE_TO_KJMOL,
+                        com=com,
+                        typ=typ,
                         src_1=filename,
                         idx_1=idx_1 + 1,
-                        idx_2=idx_2 + 1))
+                        idx_2=idx_2 + 1)
+                         for idx_2, structure in enumerate(mae.structures)])
         # For this data type, we set everything relative.
-        zero = min([x.val for x in temp])
-        for datum in temp:
-            datum.val -= zero
-        data.extend(temp)
-    # KJK
-    # FOR A SINGLE MODEL SYSTEM FITTING
-    # GAUSSIAN ENERGY
-    filename_s = coms['ge1']
-    for idx_1, filenames in enumerate(filename_s):
-        temp = []
-        for filename in filenames:
-            log = check_outs(filename, outs, filetypes.GaussLog, direc)
-            things_to_add = []
-            for thing_label in co.GAUSSIAN_ENERGIES:
-                thing = log.structures[0].props[thing_label]
-                if ',' in thing:
-                    thing = [float(x) for x in thing.split(',')]
-                else:
-                    thing = [float(thing)]
-                things_to_add.append(thing)
-            energies = [0.] * len(things_to_add[0])
-            for thing_group in things_to_add:
-                for i, thing in enumerate(thing_group):
-                    energies[i] += thing
-            energies = [x * co.HARTREE_TO_KJMOL for x in energies]
-            for i, e in enumerate(energies):
-                temp.append(datatypes.Datum(
-                        val=e,
-                        com='ge1',
-                        typ='e1',
-                        src_1=filename,
-                        idx_1=idx_1 + 1,
-                        idx_2=i + 1))
-        data.extend(temp)
-    # FOR A SINGLE MODEL SYSTEM FITTING (Comparing to Optimized structure)
-    # GAUSSIAN ENERGY
-    filename_s = coms['ge1o']
-    for idx_1, filenames in enumerate(filename_s):
-        temp = []
-        for filename in filenames:
-            log = check_outs(filename, outs, filetypes.GaussLog, direc)
-            things_to_add = []
-            for thing_label in co.GAUSSIAN_ENERGIES:
-                thing = log.structures[0].props[thing_label]
-                if ',' in thing:
-                    thing = [float(x) for x in thing.split(',')]
-                else:
-                    thing = [float(thing)]
-                things_to_add.append(thing)
-            energies = [0.] * len(things_to_add[0])
-            for thing_group in things_to_add:
-                for i, thing in enumerate(thing_group):
-                    energies[i] += thing
-            energies = [x * co.HARTREE_TO_KJMOL for x in energies]
-            for i, e in enumerate(energies):
-                temp.append(datatypes.Datum(
-                        val=e,
-                        com='ge1o',
-                        typ='e1o',
-                        src_1=filename,
-                        idx_1=idx_1 + 1,
-                        idx_2=i + 1))
+        shift_energies(temp, typ)
         data.extend(temp)
-    # GAUSSIAN ENERGIES
-    filename_s = coms['ge']
-    for idx_1, filenames in enumerate(filename_s):
+    return data
+
+def collect_gaussian_energies(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Gaussian energies (-ge, -gea, -geo, -geao, -ge1, -ge1o).
+
+    -ge1 and -ge1o are used for fitting a single model system, so those
+    energies aren't made relative.
+    """
+    data = []
+    typ = ENERGY_TYPS[com]
+    for idx_1, filenames in enumerate(groups):
         temp = []
         for filename in filenames:
             log = check_outs(filename, outs, filetypes.GaussLog, direc)
@@ -878,15 +1203,14 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
                 # would have energies = [0.634 + 0.01234, 0.2352 + 0.0164].
                 for i, thing in enumerate(thing_group):
                     energies[i] += thing
-            energies = [x * co.HARTREE_TO_KJMOL for x in energies]
-            for i, e in enumerate(energies):
-                temp.append(datatypes.Datum(
-                        val=e,
-                        com='ge',
-                        typ='e',
+            temp.extend([datatypes.Datum(
+                        val=e * co.HARTREE_TO_KJMOL,
+                        com=com,
+                        typ=typ,
                         src_1=filename,
                         idx_1=idx_1 + 1,
-                        idx_2=i + 1))
+                        idx_2=i + 1)
+                         for i, e in enumerate(energies)])
 
             # This works when HF and ZeroPoint are used. Had to make it more
             # general.
@@ -928,14 +1252,23 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
             #         src_1=filename,
             #         idx_1=idx_1 + 1))
 
-        zero = min([x.val for x in temp])
-        for datum in temp:
-            datum.val -= zero
+        shift_energies(temp, typ)
         data.extend(temp)
-    # MACROMODEL ENERGIES
-    filenames_s = coms['me']
-    ind = 'pre'
-    for idx_1, filenames in enumerate(filenames_s):
+    return data
+
+def collect_macromodel_energies(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel energies (-me, -mea, -meo, -meao).
+    """
+    data = []
+    typ = ENERGY_TYPS[com]
+    if com in COM_ENERGY_PRE:
+        ind = 'pre'
+    else:
+        ind = 'opt'
+    for idx_1, filenames in enumerate(groups):
+        temp = []
         for filename in filenames:
             name_mae = inps[filename].name_mae
             mae = check_outs(name_mae, outs, filetypes.Mae, direc)
@@ -944,113 +1277,131 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
             # number of the structure. The 2nd value is the structure class.
             selected_structures = filetypes.select_structures(
                 mae.structures, indices, ind)
-            for idx_2, structure in selected_structures:
-                data.append(datatypes.Datum(
+            temp.extend([datatypes.Datum(
                         val=structure.props['r_mmod_Potential_Energy-MM3*'],
-                        com='me',
-                        typ='e',
+                        com=com,
+                        typ=typ,
                         src_1=inps[filename].name_mae,
                         idx_1=idx_1 + 1,
-                        idx_2=idx_2 + 1))
-    # KJK
-    # GAUSSIAN TO AMBER BONDS (PRE OPT)
-    filenames_s = coms['gab']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'gab', 'pre', 'bonds', idx_1 = idx_1))
-        data.extend(temp) 
-    # GAUSSIAN TO AMBER ANGLES (PRE OPT)
-    filenames_s = coms['gaa']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'gaao', 'pre', 'angles', idx_1 = idx_1))
-        data.extend(temp) 
-    # GAUSSIAN TO AMBER TORSIONS (PRE OPT)
-    filenames_s = coms['gat']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'gato', 'pre', 'torsions', idx_1 = idx_1))
-        data.extend(temp) 
-    # GAUSSIAN TO AMBER BONDS (POST OPT)
-    filenames_s = coms['gabo']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'gabo', 'opt', 'bonds', idx_1 = idx_1))
-        data.extend(temp) 
-    # GAUSSIAN TO AMBER ANGLES (POST OPT)
-    filenames_s = coms['gaao']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'gaao', 'opt', 'angles', idx_1 = idx_1))
-        data.extend(temp) 
-    # GAUSSIAN TO AMBER TORSIONS (POST OPT)
-    filenames_s = coms['gato']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'gato', 'opt', 'torsions', idx_1 = idx_1))
-        data.extend(temp) 
-    # AMBER BONDS
-    filenames_s = coms['abo']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'abo', 'opt', 'bonds', idx_1 = idx_1))
-        data.extend(temp) 
-    # AMBER ANGLES
-    filenames_s = coms['aao']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'aao', 'opt', 'angles', idx_1 = idx_1))
-        data.extend(temp) 
-    # AMBER TORSIONS
-    filenames_s = coms['ato']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.extend(collect_structural_data_from_amber_geo(
-                filename, inps, outs, direc, 'ato', 'opt', 'torsions', idx_1 = idx_1))
-        data.extend(temp) 
-    # AMBER ENERGY
-    filenames_s = coms['ae1']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.append(collect_structural_data_from_amber_ene(
-                filename, inps, outs, direc, 'ae1', 'pre', 'e1', idx_1 = idx_1))
-        data.extend(temp) 
+                        idx_2=idx_2 + 1)
+                         for idx_2, structure in selected_structures])
+        # Only the average energies are made relative here. The others are
+        # compared to reference energies using compare.correlate_energies.
+        if typ in TYP_ENERGY_AVG:
+            shift_energies(temp, typ)
+        data.extend(temp)
+    return data
 
-    # AMBER OPTIMIZED ENERGY
-    filenames_s = coms['ae1o']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
+def collect_tinker_energies(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Tinker energies (-te, -tea, -teo, -teao).
+    """
+    data = []
+    typ = ENERGY_TYPS[com]
+    if com in COM_ENERGY_PRE:
+        ind = 'pre'
+    else:
+        ind = 'opt'
+    for idx_1, filenames in enumerate(groups):
+        temp = [collect_structural_data_from_tinker_log(
+                filename, inps, outs, direc, com, ind, typ, idx_1 = idx_1)
+                for filename in filenames]
+        shift_energies(temp, typ)
+        data.extend(temp)
+    return data
+
+def collect_amber_energies(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Amber energies (-ae1, -ae1o).
+    """
+    data = []
+    typ = ENERGY_TYPS[com]
+    if com in COM_ENERGY_PRE:
+        ind = 'pre'
+    else:
+        ind = 'opt'
+    for idx_1, filenames in enumerate(groups):
+        data.extend([collect_structural_data_from_amber_ene(
+                filename, inps, outs, direc, com, ind, typ, idx_1 = idx_1)
+                     for filename in filenames])
+    return data
+
+# Data types and structures used for the geometric commands.
+GEO_TYPS = {
+    'b': 'bonds', 'a': 'angles', 't': 'torsions'}
+
+def collect_mae_geometry(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Jaguar and MacroModel bonds, angles and torsions (-jb, -ja, -jt, -mb,
+    -ma, -mt). The Jaguar data is taken from the structure prior to the
+    MacroModel optimization.
+    """
+    data = []
+    typ = GEO_TYPS[com[-1]]
+    if com.startswith('j'):
+        ind = 'pre'
+    else:
+        ind = 'opt'
+    for filename in chain.from_iterable(groups):
+        data.extend(collect_structural_data_from_mae(
+                filename, inps, outs, direc, sub_names, com, ind, typ))
+    return data
+
+def collect_tinker_geometry(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Tinker bonds, angles and torsions (-tb, -ta, -tt, -tbo, -tao, -tto).
+    Also handles Gaussian bonds, angles and torsions extracted using
+    Tinker (-gtb, -gta, -gtt).
+    """
+    data = []
+    if com.startswith('g'):
+        typ = GEO_TYPS[com[-1]]
+        for filename in chain.from_iterable(groups):
+            data.extend(collect_structural_data_from_tinker_log_for_gaussian(
+                    filename, inps, outs, direc, com, 'pre', typ))
+        return data
+    if com.endswith('o'):
+        typ = GEO_TYPS[com[-2]]
+        ind = 'opt'
+    else:
+        typ = GEO_TYPS[com[-1]]
+        ind = 'pre'
+    for filename in chain.from_iterable(groups):
+        data.extend(collect_structural_data_from_tinker_log(
+                filename, inps, outs, direc, com, ind, typ))
+    return data
+
+def collect_amber_geometry(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Amber bonds, angles and torsions (-abo, -aao, -ato). Also handles
+    Gaussian bonds, angles and torsions extracted using Amber (-gab, -gaa,
+    -gat, -gabo, -gaao, -gato).
+    """
+    data = []
+    if com.endswith('o'):
+        typ = GEO_TYPS[com[-2]]
+        ind = 'opt'
+    else:
+        typ = GEO_TYPS[com[-1]]
+        ind = 'pre'
+    for idx_1, filenames in enumerate(groups):
         for filename in filenames:
-            temp.append(collect_structural_data_from_amber_ene(
-                filename, inps, outs, direc, 'ae1o', 'opt', 'e1o', idx_1 = idx_1))
-        data.extend(temp) 
-        
-    # AMBER HESSIAN
-    filenames = chain.from_iterable(coms['ah'])
+            data.extend(collect_structural_data_from_amber_geo(
+                filename, inps, outs, direc, com, ind, typ, idx_1 = idx_1))
+    return data
+
+def collect_amber_hessian(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Amber Hessian (-ah).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         name_hes = inps[filename].name_hes
         hes = check_outs(name_hes, outs, filetypes.AmberHess, direc)
         hess = hes.hessian
         # hessian extracted from Amber is already mass weighted
-        low_tri_idx = np.tril_indices_from(hess)
+        low_tri_idx = low_tri_indices(hess.shape[0])
         low_tri = hess[low_tri_idx]
         int2 = []
         int3 = []
@@ -1126,364 +1477,14 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
             wht = int_wht(int((x)//3+1),int((y)//3+1)))
                 for e, x, y in zip(
                     low_tri, low_tri_idx[0], low_tri_idx[1])])
-        
-    # AMBER ENERGIES
-#    filenames_s = coms['ae']
-#    for idx_1, filenames in enumerate(filenames_s):
-#        logger.log(1, '>>> idx_1: {}'.format(idx_1))
-#        logger.log(1, '>>> filenames: {}'.format(filenames))
-#        for idx_2, comma_sep_filenames in enumerate(filenames):
-#            name_1, name_2 = comma_sep_filenames.split(',')
-#            out = check_outs(
-#                comma_sep_filenames, outs, filetypes.AmberOut, direc)
-#            # Right now, path is a comma separated string.
-#            out.path = inps[comma_sep_filenames].out
-#            logger.log(1, '>>> out: {}'.format(out))
-#            energy = out.read_energy()
-#            data.append(datatypes.Datum(
-#                val=energy,
-#                com='ae',
-#                typ='e',
-#                src_1=name_1,
-#                src_2=name_2,
-#                idx_1=idx_1 + 1,
-#                idx_2=idx_2 + 1))
-    # JAGUAR AVERAGE ENERGIES
-    filenames_s = coms['jea']
-    # idx_1 is the number used to group sets of relative energies.
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            mae = check_outs(filename, outs, filetypes.Mae, direc)
-            # idx_2 corresponds to the structure inside the file in case the
-            # .mae files contains multiple structures.
-            for idx_2, structure in enumerate(mae.structures):
-                try:
-                    energy = structure.props['r_j_Gas_Phase_Energy']
-                except KeyError:
-                    energy = structure.props['r_j_QM_Energy']
-                energy *= co.HARTREE_TO_KJMOL
-                temp.append(datatypes.Datum(
-                        val=energy,
-                        com='jea',
-                        typ='ea',
-                        src_1=filename,
-                        idx_1=idx_1 + 1,
-                        idx_2=idx_2 + 1))
-        # For this data type, we set everything relative.
-        avg = sum([x.val for x in temp]) / len(temp)
-        for datum in temp:
-            datum.val -= avg
-        data.extend(temp)
-    # GAUSSIAN AVERAGE ENERGIES
-    filename_s = coms['gea']
-    for idx_1, filenames in enumerate(filename_s):
-        temp = []
-        for filename in filenames:
-            log = check_outs(filename, outs, filetypes.GaussLog, direc)
-            things_to_add = []
-            for thing_label in co.GAUSSIAN_ENERGIES:
-                thing = log.structures[0].props[thing_label]
-                if ',' in thing:
-                    thing = [float(x) for x in thing.split(',')]
-                else:
-                    thing = [float(thing)]
-                things_to_add.append(thing)
-            energies = [0.] * len(things_to_add[0])
-            for thing_group in things_to_add:
-                for i, thing in enumerate(thing_group):
-                    energies[i] += thing
-            energies = [x * co.HARTREE_TO_KJMOL for x in energies]
-            for i, e in enumerate(energies):
-                temp.append(datatypes.Datum(
-                        val=e,
-                        com='gea',
-                        typ='ea',
-                        src_1=filename,
-                        idx_1=idx_1 + 1,
-                        idx_2=i + 1))
-        avg = sum([x.val for x in temp]) / len(temp)
-        for datum in temp:
-            datum.val -= avg
-        data.extend(temp)
-    # MACROMODEL AVERAGE ENERGIES
-    filenames_s = coms['mea']
-    ind = 'pre'
-    # idx_1 is the number used to group sets of relative energies.
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            name_mae = inps[filename].name_mae
-            mae = check_outs(name_mae, outs, filetypes.Mae, direc)
-            indices = inps[filename]._index_output_mae
-            # This is list of sets. The 1st value in the set corresponds to the
-            # number of the structure. The 2nd value is the structure class.
-            selected_structures = filetypes.select_structures(
-                mae.structures, indices, ind)
-            for idx_2, structure in selected_structures:
-                temp.append(datatypes.Datum(
-                        val=structure.props['r_mmod_Potential_Energy-MM3*'],
-                        com='mea',
-                        typ='ea',
-                        src_1=inps[filename].name_mae,
-                        idx_1=idx_1 + 1,
-                        idx_2=idx_2 + 1))
-        avg = sum([x.val for x in temp]) / len(temp)
-        for datum in temp:
-            datum.val -= avg
-        data.extend(temp)
-    # JAGUAR ENERGIES COMPARED TO OPTIMIZED MM
-    filenames_s = coms['jeo']
-    # idx_1 is the number used to group sets of relative energies.
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            mae = check_outs(filename, outs, filetypes.Mae, direc)
-            # idx_2 corresponds to the structure inside the file in case the
-            # .mae files contains multiple structures.
-            for idx_2, structure in enumerate(mae.structures):
-                try:
-                    energy = structure.props['r_j_Gas_Phase_Energy']
-                except KeyError:
-                    energy = structure.props['r_j_QM_Energy']
-                energy *= co.HARTREE_TO_KJMOL
-                temp.append(datatypes.Datum(
-                        val=energy,
-                        com='jeo',
-                        typ='eo',
-                        src_1=filename,
-                        idx_1=idx_1 + 1,
-                        idx_2=idx_2 + 1))
-        # For this data type, we set everything relative.
-        zero = min([x.val for x in temp])
-        for datum in temp:
-            datum.val -= zero
-        data.extend(temp)
-    # GAUSSIAN ENERGIES RELATIVE TO OPTIMIZED MM
-    filename_s = coms['geo']
-    for idx_1, filenames in enumerate(filename_s):
-        temp = []
-        for filename in filenames:
-            log = check_outs(filename, outs, filetypes.GaussLog, direc)
-            things_to_add = []
-            for thing_label in co.GAUSSIAN_ENERGIES:
-                thing = log.structures[0].props[thing_label]
-                if ',' in thing:
-                    thing = [float(x) for x in thing.split(',')]
-                else:
-                    thing = [float(thing)]
-                things_to_add.append(thing)
-            energies = [0.] * len(things_to_add[0])
-            for thing_group in things_to_add:
-                for i, thing in enumerate(thing_group):
-                    energies[i] += thing
-            energies = [x * co.HARTREE_TO_KJMOL for x in energies]
-            for i, e in enumerate(energies):
-                temp.append(datatypes.Datum(
-                        val=e,
-                        com='geo',
-                        typ='eo',
-                        src_1=filename,
-                        idx_1=idx_1 + 1,
-                        idx_2=i + 1))
-        zero = min([x.val for x in temp])
-        for datum in temp:
-            datum.val -= zero
-        data.extend(temp)
-    # MACROMODEL OPTIMIZED ENERGIES
-    filenames_s = coms['meo']
-    ind = 'opt'
-    for idx_1, filenames in enumerate(filenames_s):
-        for filename in filenames:
-            name_mae = inps[filename].name_mae
-            mae = check_outs(name_mae, outs, filetypes.Mae, direc)
-            indices = inps[filename]._index_output_mae
-            selected_structures = filetypes.select_structures(
-                mae.structures, indices, ind)
-            for idx_2, structure in selected_structures:
-                data.append(datatypes.Datum(
-                        val=structure.props['r_mmod_Potential_Energy-MM3*'],
-                        com='meo',
-                        typ='eo',
-                        src_1=inps[filename].name_mae,
-                        idx_1=idx_1 + 1,
-                        idx_2=idx_2 + 1))
-    # JAGUAR ENERGIES RELATIVE TO AVERAGE COMPARED TO OPTIMIZED MM
-    filenames_s = coms['jeao']
-    # idx_1 is the number used to group sets of relative energies.
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            mae = check_outs(filename, outs, filetypes.Mae, direc)
-            # idx_2 corresponds to the structure inside the file in case the
-            # .mae files contains multiple structures.
-            for idx_2, structure in enumerate(mae.structures):
-                try:
-                    energy = structure.props['r_j_Gas_Phase_Energy']
-                except KeyError:
-                    energy = structure.props['r_j_QM_Energy']
-                energy *= co.HARTREE_TO_KJMOL
-                temp.append(datatypes.Datum(
-                        val=energy,
-                        com='jeao',
-                        typ='eao',
-                        src_1=filename,
-                        idx_1=idx_1 + 1,
-                        idx_2=idx_2 + 1))
-        avg = sum([x.val for x in temp]) / len(temp)
-        for datum in temp:
-            datum.val -= avg
-        data.extend(temp)
-    # GAUSSIAN AVERAGE ENERGIES RELATIVE TO OPTIMIZED MM
-    filename_s = coms['geao']
-    for idx_1, filenames in enumerate(filename_s):
-        temp = []
-        for filename in filenames:
-            log = check_outs(filename, outs, filetypes.GaussLog, direc)
-            things_to_add = []
-            for thing_label in co.GAUSSIAN_ENERGIES:
-                thing = log.structures[0].props[thing_label]
-                if ',' in thing:
-                    thing = [float(x) for x in thing.split(',')]
-                else:
-                    thing = [float(thing)]
-                things_to_add.append(thing)
-            energies = [0.] * len(things_to_add[0])
-            for thing_group in things_to_add:
-                for i, thing in enumerate(thing_group):
-                    energies[i] += thing
-            energies = [x * co.HARTREE_TO_KJMOL for x in energies]
-            for i, e in enumerate(energies):
-                temp.append(datatypes.Datum(
-                        val=e,
-                        com='geao',
-                        typ='eao',
-                        src_1=filename,
-                        idx_1=idx_1 + 1,
-                        idx_2=i + 1))
-        avg = sum([x.val for x in temp]) / len(temp)
-        for datum in temp:
-            datum.val -= avg
-        data.extend(temp)
-    # MACROMODEL OPTIMIZED ENERGIES RELATIVE TO AVERAGE
-    filenames_s = coms['meao']
-    ind = 'opt'
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            name_mae = inps[filename].name_mae
-            mae = check_outs(name_mae, outs, filetypes.Mae, direc)
-            indices = inps[filename]._index_output_mae
-            selected_structures = filetypes.select_structures(
-                mae.structures, indices, ind)
-            for idx_2, structure in selected_structures:
-                temp.append(datatypes.Datum(
-                        val=structure.props['r_mmod_Potential_Energy-MM3*'],
-                        com='meao',
-                        typ='eao',
-                        src_1=inps[filename].name_mae,
-                        idx_1=idx_1 + 1,
-                        idx_2=idx_2 + 1))
-        avg = sum([x.val for x in temp]) / len(temp)
-        for datum in temp:
-            datum.val -= avg
-        data.extend(temp)
-    # JAGUAR BONDS
-    filenames = chain.from_iterable(coms['jb'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_mae(
-                filename, inps, outs, direc, sub_names, 'jb', 'pre', 'bonds'))
-    # GAUSSIAN BONDS
-    filenames = chain.from_iterable(coms['gtb'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log_for_gaussian(
-                filename, inps, outs, direc, 'gtb', 'pre', 'bonds'))
-    # GAUSSIAN ANGLES
-    filenames = chain.from_iterable(coms['gta'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log_for_gaussian(
-                filename, inps, outs, direc, 'gta', 'pre', 'angles'))
-    # GAUSSIAN TORSIONS
-    filenames = chain.from_iterable(coms['gtt'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log_for_gaussian(
-                filename, inps, outs, direc, 'gtt', 'pre', 'torsions'))
-    # TINKER SP BONDS
-    filenames = chain.from_iterable(coms['tb'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'tb', 'pre', 'bonds'))
-    # TINKER SP ANGLES
-    filenames = chain.from_iterable(coms['ta'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'ta', 'pre', 'angles'))
-    # TINKER SP TORSIONS
-    filenames = chain.from_iterable(coms['tt'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'tt', 'pre', 'torsions'))
-    # TINKER OPTIMIZED BONDS
-    filenames = chain.from_iterable(coms['tbo'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'tbo', 'opt', 'bonds'))
-    # TINKER OPTIMIZED ANGLE
-    filenames = chain.from_iterable(coms['tao'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'tao', 'opt', 'angles'))
-    # TINKER OPTIMIZED ANGLE
-    filenames = chain.from_iterable(coms['tto'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'tto', 'opt', 'torsions'))
-    # TINKER ENERGIES RELATIVE TO LOWEST
-    filenames_s = coms['te']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.append(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'te', 'pre', 'e', idx_1 = idx_1))
-        zero = min([x.val for x in temp])
-        for datum in temp:
-            datum.val -= zero
-        data.extend(temp)
-    # TINKER ENERGIES RELATIVE TO AVERAGE
-    filenames_s = coms['tea']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.append(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'tea', 'pre', 'ea', idx_1 = idx_1))
-        avg = sum([x.val for x in temp]) / len(temp)
-        for datum in temp:
-            datum.val -= avg
-        data.extend(temp)
-    # TINKER OPTIMIZED ENERGIES RELATIVE LOWEST
-    filenames_s = coms['teo']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.append(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'teo', 'opt', 'eo', idx_1 = idx_1))
-        zero = min([x.val for x in temp])
-        for datum in temp:
-            datum.val -= zero
-        data.extend(temp)
-    # TINKER OPTIMIZED ENERGIES RELATIVE TO AVERAGE
-    filenames_s = coms['teao']
-    for idx_1, filenames in enumerate(filenames_s):
-        temp = []
-        for filename in filenames:
-            temp.append(collect_structural_data_from_tinker_log(
-                filename, inps, outs, direc, 'teao', 'opt', 'eao', idx_1 = idx_1))
-        avg = sum([x.val for x in temp]) / len(temp)
-        for datum in temp:
-            datum.val -= avg
-        data.extend(temp)
-    # TINKER HESSIAN
-    filenames = chain.from_iterable(coms['th'])
+    return data
+
+def collect_tinker_hessian(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Tinker Hessian (-th).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         xyz_struct = inps[filename].structures[0]
         num_atoms = xyz_struct.props['total atoms']
@@ -1494,7 +1495,7 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
         datatypes.mass_weight_hessian(hess, xyz_struct.atoms)
         # Need to figure out dummy atoms at somepoint?
         # I'm not even sure if we can use dummy atoms in TINKER.
-        low_tri_idx = np.tril_indices_from(hess)
+        low_tri_idx = low_tri_indices(hess.shape[0])
         low_tri = hess[low_tri_idx]
         data.extend([datatypes.Datum(
             val=e,
@@ -1505,12 +1506,19 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
             idx_2=y + 1)
                 for e, x, y in zip(
                     low_tri, low_tri_idx[0], low_tri_idx[1])])
-    # TINKER EIGENMATRIX USING GAUSSIAN EIGENVECTORS
-    filenames = chain.from_iterable(coms['tgeig'])
+    return data
+
+def collect_tinker_gaussian_eigenmatrix(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Tinker eigenmatrix using Gaussian eigenvectors (-tgeig).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for comma_filenames in filenames:
         name_xyz, name_gau_log = comma_filenames.split(',')
         name_xyz_hes = inps[name_xyz].name_hes
-        xyz = check_outs(name_xyz, outs, filetypes.Tinker_xyz, direc)
+        xyz = check_outs(name_xyz, outs, filetypes.TinkerXYZ, direc)
         xyz_hes = check_outs(name_xyz_hes, outs, filetypes.TinkerHess, direc)
         gau_log = check_outs(name_gau_log, outs, filetypes.GaussLog, direc)
         xyz_struct = xyz.structures[0]
@@ -1524,68 +1532,34 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
         except ValueError:
             logger.warning('Matrices not aligned!')
             logger.warning('Hessian retrieved from {}: {}'.format(
-                    name_mae_log, hess.shape))
+                    name_xyz_hes, hess.shape))
             logger.warning('Eigenvectors retrieved from {}: {}'.format(
                     name_gau_log, evec.shape))
             raise
-        low_tri_idx = np.tril_indices_from(eigenmatrix)
-        low_tri = eigenmatrix[low_tri_idx]
-        data.extend([datatypes.Datum(
-            val=e,
-            com='tgeig',
-            typ='eig',
-            src_1=name_xyz,
-            src_2=name_gau_log,
-            idx_1=x + 1,
-            idx_2=y + 1)
-                for e, x, y in zip(
-                    low_tri, low_tri_idx[0], low_tri_idx[1])])
-    # MACROMODEL BONDS
-    filenames = chain.from_iterable(coms['mb'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_mae(
-                filename, inps, outs, direc, sub_names, 'mb', 'opt', 'bonds'))
-    # JAGUAR ANGLES
-    filenames = chain.from_iterable(coms['ja'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_mae(
-                filename, inps, outs, direc, sub_names, 'ja', 'pre', 'angles'))
-    # MACROMODEL BONDS
-    filenames = chain.from_iterable(coms['ma'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_mae(
-                filename, inps, outs, direc, sub_names, 'ma', 'opt', 'angles'))
-    # JAGUAR BONDS
-    filenames = chain.from_iterable(coms['jt'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_mae(
-                filename, inps, outs, direc, sub_names, 'jt', 'pre', 'torsions'))
-    # MACROMODEL BONDS
-    filenames = chain.from_iterable(coms['mt'])
-    for filename in filenames:
-        data.extend(collect_structural_data_from_mae(
-                filename, inps, outs, direc, sub_names, 'mt', 'opt', 'torsions'))
-    # JAGUAR CHARGES
-    filenames = chain.from_iterable(coms['jq'])
+        data.extend(make_eig_data(
+            eigenmatrix, 'tgeig', name_xyz, src_2=name_gau_log))
+    return data
+
+def collect_jaguar_charges(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Jaguar charges (-jq).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         mae = check_outs(filename, outs, filetypes.Mae, direc)
         for idx_1, structure in enumerate(mae.structures):
-            for atom in structure.atoms:
-                # If it doesn't have the property b_q_use_charge,
-                # use it.
-                # If b_q_use_charge is 1, use it. If it's 0, don't
-                # use it.
-                if not 'b_q_use_charge' in atom.props or \
-                        atom.props['b_q_use_charge']:
-                    data.append(datatypes.Datum(
-                            val=atom.partial_charge,
-                            com='jq',
-                            typ='q',
-                            src_1=filename,
-                            idx_1=idx_1 + 1,
-                            atm_1=atom.index))
-    # MACROMODEL CHARGES
-    filenames = chain.from_iterable(coms['mq'])
+            data.extend(make_charge_data(
+                structure, 'jq', 'q', filename, idx_1 + 1))
+    return data
+
+def collect_macromodel_charges(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel charges (-mq).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         name_mae = inps[filename].name_mae
         mae = check_outs(name_mae, outs, filetypes.Mae, direc)
@@ -1595,18 +1569,17 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
         structures = filetypes.select_structures(
             mae.structures, inps[filename]._index_output_mae, 'pre')
         for idx_1, structure in structures:
-            for atom in structure.atoms:
-                if not 'b_q_use_charge' in atom.props or \
-                        atom.props['b_q_use_charge']:
-                    data.append(datatypes.Datum(
-                            val=atom.partial_charge,
-                            com='mq',
-                            typ='q',
-                            src_1=filename,
-                            idx_1=idx_1 + 1,
-                            atm_1=atom.index))
-    # MACROMODEL+GUASSIAN ESP   
-    filenames = chain.from_iterable(coms['mgESP'])
+            data.extend(make_charge_data(
+                structure, 'mq', 'q', filename, idx_1 + 1))
+    return data
+
+def collect_macromodel_gaussian_esp(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel charges fit to the Gaussian ESP (-mgESP).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for comma_filenames in filenames:
         charges_list = []
         filename_mae, name_gau_chk = comma_filenames.split(',')
@@ -1640,9 +1613,16 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
                             src_1= name_mae,
                             src_2='gaussian',
                             idx_1 = 1))
-    # MACROMODEL+JAGUAR ESP   
+    return data
+
+def collect_macromodel_jaguar_esp(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel charges fit to the Jaguar ESP (-mjESP).
+    """
+    data = []
     ## This does not work, I still need to write code to support Jaguaer. -TR
-    filenames = chain.from_iterable(coms['mjESP'])
+    filenames = chain.from_iterable(groups)
     for comma_filenames in filenames:
         charges_list = []
         name_mae, name_jag_chk = comma_filenames.split(',')
@@ -1667,35 +1647,40 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
                             typ='esp',
                             src_1=name_mae,
                             idx_1=1))
-    # JAGUAR CHARGES EXCLUDING ALIPHATIC HYDROGENS
-    filenames = chain.from_iterable(coms['jqh'])
+    return data
+
+def collect_jaguar_charges_no_aliph_hyds(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Jaguar charges excluding aliphatic hydrogens (-jqh).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         mae = check_outs(filename, outs, filetypes.Mae, direc)
         for idx_1, structure in enumerate(mae.structures):
-            aliph_hyds = structure.get_aliph_hyds()
-            for atom in structure.atoms:
-                # If it doesn't have the property b_q_use_charge,
-                # use it.
-                # If b_q_use_charge is 1, use it. If it's 0, don't
-                # use it.
-                if (not 'b_q_use_charge' in atom.props or \
-                        atom.props['b_q_use_charge']) and \
-                        not atom in aliph_hyds:
-                    charge = atom.partial_charge
-                    if atom.atom_type == 3:
-                        for bonded_atom_index in atom.bonded_atom_indices:
-                            bonded_atom = structure.atoms[bonded_atom_index - 1]
-                            if bonded_atom in aliph_hyds:
-                                charge += bonded_atom.partial_charge
-                    data.append(datatypes.Datum(
-                            val=charge,
-                            com='jqh',
-                            typ='qh',
-                            src_1=filename,
-                            idx_1=idx_1 + 1,
-                            atm_1=atom.index))
-    # MACROMODEL CHARGES EXCLUDING ALIPHATIC HYDROGENS
-    filenames = chain.from_iterable(coms['mqh'])
+            # A set makes the membership checks below constant time.
+            # Atoms are hashed by identity, same as the list comparison.
+            aliph_hyds = set(structure.get_aliph_hyds())
+            # The charges of the aliphatic hydrogens are added onto the
+            # atoms of type 3 that they're bonded to.
+            folds = [(i, bonded_atom_index - 1)
+                     for i, atom in enumerate(structure.atoms)
+                     if atom.atom_type == 3
+                     for bonded_atom_index in atom.bonded_atom_indices
+                     if structure.atoms[bonded_atom_index - 1] in aliph_hyds]
+            data.extend(make_charge_data(
+                structure, 'jqh', 'qh', filename, idx_1 + 1,
+                exclude=aliph_hyds, folds=folds))
+    return data
+
+def collect_macromodel_charges_no_aliph_hyds(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel charges excluding aliphatic hydrogens (-mqh).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         name_mae = inps[filename].name_mae
         mae = check_outs(name_mae, outs, filetypes.Mae, direc)
@@ -1705,62 +1690,55 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
         structures = filetypes.select_structures(
             mae.structures, inps[filename]._index_output_mae, 'pre')
         for idx_1, structure in structures:
-            aliph_hyds = structure.get_aliph_hyds()
-            for atom in structure.atoms:
-                if (not 'b_q_use_charge' in atom.props or \
-                        atom.props['b_q_use_charge']) and \
-                        atom not in aliph_hyds:
-
-                    # Since the charge is always zero AS FAR AS I KNOW, this
-                    # whole recalculation of the charge is totally unnecessary.
-                    # However, I want users to be aware that if a situation
-                    # arises that goes beyond something I experienced,
-                    # uncommenting this section, thereby making it more like the
-                    # code for -jqh, should solve the problem.
-
-                    # charge = atom.partial_charge
-                    # if atom.atom_type == 3:
-                    #     for bonded_atom_index in atom.bonded_atom_indices:
-                    #         bonded_atom = structure.atoms[bonded_atom_index - 1]
-                    #         if bonded_atom in aliph_hyds:
-                    #             charge += bonded_atom.partial_charge
-
-                    data.append(datatypes.Datum(
-                            # val=charge,
-                            val=atom.partial_charge,
-                            com='mqh',
-                            typ='qh',
-                            src_1=filename,
-                            idx_1=idx_1 + 1,
-                            atm_1=atom.index))
-    # JAGUAR CHARGES EXCLUDING ALL SINGLE BONDED HYDROGENS
-    filenames = chain.from_iterable(coms['jqa'])
+            # A set makes the membership checks below constant time.
+            # Atoms are hashed by identity, same as the list comparison.
+            aliph_hyds = set(structure.get_aliph_hyds())
+
+            # Since the charge is always zero AS FAR AS I KNOW, this
+            # whole recalculation of the charge is totally unnecessary.
+            # However, I want users to be aware that if a situation
+            # arises that goes beyond something I experienced,
+            # passing the same folds used for -jqh, thereby making it more
+            # like the code for -jqh, should solve the problem.
+
+            data.extend(make_charge_data(
+                structure, 'mqh', 'qh', filename, idx_1 + 1,
+                exclude=aliph_hyds))
+    return data
+
+def collect_jaguar_charges_no_hyds(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Jaguar charges excluding all single bonded hydrogens (-jqa).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         mae = check_outs(filename, outs, filetypes.Mae, direc)
         for idx_1, structure in enumerate(mae.structures):
-            hyds = structure.get_hyds()
-            for atom in structure.atoms:
-                # Check if we want to use this charge and ensure it's not a
-                # hydrogen.
-                if (not 'b_q_use_charge' in atom.props or \
-                        atom.props['b_q_use_charge']) and \
-                        atom not in hyds:
-                    charge = atom.partial_charge
-                    # Check if it's bonded to a hydrogen.
-                    for bonded_atom_index in atom.bonded_atom_indices:
-                        bonded_atom = structure.atoms[bonded_atom_index - 1]
-                        if bonded_atom in hyds:
-                            if len(bonded_atom.bonded_atom_indices) < 2:
-                                charge += bonded_atom.partial_charge
-                    data.append(datatypes.Datum(
-                            val=charge,
-                            com='jqa',
-                            typ='qa',
-                            src_1=filename,
-                            idx_1=idx_1 + 1,
-                            atm_1=atom.index))
-    # MACROMODEL CHARGES EXCLUDING ALL SINGLE BONDED HYDROGENS
-    filenames = chain.from_iterable(coms['mqa'])
+            # get_hyds repeats an atom for each of its bonds. The set drops
+            # the repeats and makes membership checks constant time.
+            hyds = set(structure.get_hyds())
+            # The charges of single bonded hydrogens are added onto the
+            # atoms they're bonded to.
+            folds = [(i, bonded_atom_index - 1)
+                     for i, atom in enumerate(structure.atoms)
+                     if atom not in hyds
+                     for bonded_atom_index in atom.bonded_atom_indices
+                     if is_single_bonded_hyd(
+                         structure.atoms[bonded_atom_index - 1], hyds)]
+            data.extend(make_charge_data(
+                structure, 'jqa', 'qa', filename, idx_1 + 1,
+                exclude=hyds, folds=folds))
+    return data
+
+def collect_macromodel_charges_no_hyds(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel charges excluding all single bonded hydrogens (-mqa).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         name_mae = inps[filename].name_mae
         mae = check_outs(name_mae, outs, filetypes.Mae, direc)
@@ -1770,26 +1748,28 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
         structures = filetypes.select_structures(
             mae.structures, inps[filename]._index_output_mae, 'pre')
         for idx_1, structure in structures:
-            hyds = structure.get_hyds()
-            for atom in structure.atoms:
-                if (not 'b_q_use_charge' in atom.props or \
-                        atom.props['b_q_use_charge']) and \
-                        atom not in hyds:
-                    charge = atom.partial_charge
-                    for bonded_atom_index in atom.bonded_atom_indices:
-                        bonded_atom = structure.atoms[bonded_atom_index - 1]
-                        if bonded_atom in hyds:
-                            if len(bonded_atom.bonded_atom_indices) < 2:
-                                charge += bonded_atom.partial_charge
-                    data.append(datatypes.Datum(
-                            val=charge,
-                            com='mqa',
-                            typ='qa',
-                            src_1=filename,
-                            idx_1=idx_1 + 1,
-                            atm_1=atom.index))
-    # JAGUAR HESSIAN
-    filenames = chain.from_iterable(coms['jh'])
+            # get_hyds repeats an atom for each of its bonds. The set drops
+            # the repeats and makes membership checks constant time.
+            hyds = set(structure.get_hyds())
+            # The charges of single bonded hydrogens are added onto the
+            # atoms they're bonded to.
+            folds = [(i, bonded_atom_index - 1)
+                     for i, atom in enumerate(structure.atoms)
+                     if atom not in hyds
+                     for bonded_atom_index in atom.bonded_atom_indices
+                     if is_single_bonded_hyd(
+                         structure.atoms[bonded_atom_index - 1], hyds)]
+            data.extend(make_charge_data(
+                structure, 'mqa', 'qa', filename, idx_1 + 1,
+                exclude=hyds, folds=folds))
+    return data
+
+def collect_jaguar_hessian(com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Jaguar Hessian (-jh).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         jin = check_outs(filename, outs, filetypes.JaguarIn, direc)
         hess = jin.hessian
@@ -1797,9 +1777,12 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
         if invert:
             evals, evecs = np.linalg.eigh(hess)
             datatypes.replace_minimum(evals, value=invert)
-            hess = evecs.dot(np.diag(evals).dot(evecs.T))
+            # Same as evecs.dot(np.diag(evals).dot(evecs.T)), but scaling the
+            # columns avoids building the dense diagonal matrix and one of
+            # the matrix products.
+            hess = (evecs * evals).dot(evecs.T)
         datatypes.replace_minimum(hess, value=invert)
-        low_tri_idx = np.tril_indices_from(hess)
+        low_tri_idx = low_tri_indices(hess.shape[0])
         low_tri = hess[low_tri_idx]
         data.extend([datatypes.Datum(
                     val=e,
@@ -1810,8 +1793,15 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
                     idx_2=y + 1)
                      for e, x, y in zip(
                     low_tri, low_tri_idx[0], low_tri_idx[1])])
-    # GAUSSIAN HESSIAN
-    filenames = chain.from_iterable(coms['gh'])
+    return data
+
+def collect_gaussian_hessian(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Gaussian Hessian (-gh).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         log = check_outs(filename, outs, filetypes.GaussLog, direc)
         log.read_archive()
@@ -1825,10 +1815,13 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
             # Returns True.
             # print(np.allclose(evecs.dot(np.diag(evals).dot(evecs.T)), hess))
             datatypes.replace_minimum(evals, value=invert)
-            hess = evecs.dot(np.diag(evals).dot(evecs.T))
+            # Same as evecs.dot(np.diag(evals).dot(evecs.T)), but scaling the
+            # columns avoids building the dense diagonal matrix and one of
+            # the matrix products.
+            hess = (evecs * evals).dot(evecs.T)
         # Oh crap, just realized this probably needs to be mass weighted.
         # WARNING: This option may need to be mass weighted!
-        low_tri_idx = np.tril_indices_from(hess)
+        low_tri_idx = low_tri_indices(hess.shape[0])
         low_tri = hess[low_tri_idx]
         data.extend([datatypes.Datum(
                     val=e,
@@ -1839,8 +1832,15 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
                     idx_2=y + 1)
                      for e, x, y in zip(
                     low_tri, low_tri_idx[0], low_tri_idx[1])])
-    # MACROMODEL HESSIAN
-    filenames = chain.from_iterable(coms['mh'])
+    return data
+
+def collect_macromodel_hessian(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel Hessian (-mh).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         # Get the .log for the .mae.
         name_log = inps[filename].name_log
@@ -1852,7 +1852,7 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
         dummies = mae.structures[0].get_dummy_atom_indices()
         hess_dummies = datatypes.get_dummy_hessian_indices(dummies)
         hess = datatypes.check_mm_dummy(hess, hess_dummies)
-        low_tri_idx = np.tril_indices_from(hess)
+        low_tri_idx = low_tri_indices(hess.shape[0])
         low_tri = hess[low_tri_idx]
         data.extend([datatypes.Datum(
                     val=e,
@@ -1863,8 +1863,15 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
                     idx_2=y + 1)
                      for e, x, y in zip(
                     low_tri, low_tri_idx[0], low_tri_idx[1])])
-    # JAGUAR EIGENMATRIX
-    filenames = chain.from_iterable(coms['jeigz'])
+    return data
+
+def collect_jaguar_eigenmatrix(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Jaguar eigenmatrix with the off-diagonal elements zeroed (-jeigz).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for comma_sep_filenames in filenames:
         name_in, name_out = comma_sep_filenames.split(',')
         jin = check_outs(name_in, outs, filetypes.JaguarIn, direc)
@@ -1873,8 +1880,10 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
         evec = out.eigenvectors
         datatypes.mass_weight_hessian(hess, jin.structures[0].atoms)
         datatypes.mass_weight_eigenvectors(evec, out.structures[0].atoms)
+        # Only the diagonal of evec * hess * evec.T is used, so compute
+        # just that (one matrix product) rather than the full eigenmatrix.
         try:
-            eigenmatrix = np.dot(np.dot(evec, hess), evec.T)
+            eigenmatrix = (np.dot(evec, hess) * evec).sum(axis=1)
         except ValueError:
             logger.warning('Matrices not aligned!')
             logger.warning('Hessian retrieved from {}: {}'.format(
@@ -1882,49 +1891,36 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
             logger.warning('Eigenvectors retrieved from {}: {}'.format(
                     name_out, evec.shape))
             raise
-
-        # Funny way to make off-diagonal elements zero.
-        # eigenmatrix = np.diag(np.diag(eigenmatrix))
-
-        # Take diagonal into one dimensional array.
-        eigenmatrix = np.diag(eigenmatrix)
         if invert:
             datatypes.replace_minimum(eigenmatrix, value=invert)
-        # Turn back into a full matrix.
-        eigenmatrix = np.diag(eigenmatrix)
-        low_tri_idx = np.tril_indices_from(eigenmatrix)
-        low_tri = eigenmatrix[low_tri_idx]
-        data.extend([datatypes.Datum(
-                    val=e,
-                    com='jeigz',
-                    typ='eig',
-                    src_1=jin.filename,
-                    src_2=out.filename,
-                    idx_1=x + 1,
-                    idx_2=y + 1)
-                     for e, x, y in zip(
-                    low_tri, low_tri_idx[0], low_tri_idx[1])])
-    # GAUSSIAN EIGENMATRIX
-    filenames = chain.from_iterable(coms['geigz'])
+        data.extend(make_eig_data(
+            eigenmatrix, 'jeigz', jin.filename, src_2=out.filename,
+            diag_only=True))
+    return data
+
+def collect_gaussian_eigenmatrix(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    Gaussian eigenmatrix with the off-diagonal elements zeroed (-geigz).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for filename in filenames:
         log = check_outs(filename, outs, filetypes.GaussLog, direc)
         evals = log.evals * co.HESSIAN_CONVERSION
         if invert:
             datatypes.replace_minimum(evals, value=invert)
-        eigenmatrix = np.diag(evals)
-        low_tri_idx = np.tril_indices_from(eigenmatrix)
-        low_tri = eigenmatrix[low_tri_idx]
-        data.extend([datatypes.Datum(
-                    val=e,
-                    com='geigz',
-                    typ='eig',
-                    src_1=log.filename,
-                    idx_1=x + 1,
-                    idx_2=y + 1)
-                     for e, x, y in zip(
-                    low_tri, low_tri_idx[0], low_tri_idx[1])])
-    # MACROMODEL EIGENMATRIX USING JAGUAR EIGENVECTORS
-    filenames = chain.from_iterable(coms['mjeig'])
+        data.extend(make_eig_data(
+            evals, 'geigz', log.filename, diag_only=True))
+    return data
+
+def collect_macromodel_jaguar_eigenmatrix(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel eigenmatrix using Jaguar eigenvectors (-mjeig).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for comma_sep_filenames in filenames:
         name_mae, name_out = comma_sep_filenames.split(',')
         name_log = inps[name_mae].name_log
@@ -1946,20 +1942,17 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
             logger.warning('Eigenvectors retrieved from {}: {}'.format(
                     name_out, evec.shape))
             raise
-        low_tri_idx = np.tril_indices_from(eigenmatrix)
-        low_tri = eigenmatrix[low_tri_idx]
-        data.extend([datatypes.Datum(
-                    val=e,
-                    com='mjeig',
-                    typ='eig',
-                    src_1=mae.filename,
-                    src_2=out.filename,
-                    idx_1=x + 1,
-                    idx_2=y + 1)
-                     for e, x, y in zip(
-                    low_tri, low_tri_idx[0], low_tri_idx[1])])
-    # MACROMODEL EIGENMATRIX USING GAUSSIAN EIGENVECTORS
-    filenames = chain.from_iterable(coms['mgeig'])
+        data.extend(make_eig_data(
+            eigenmatrix, 'mjeig', mae.filename, src_2=out.filename))
+    return data
+
+def collect_macromodel_gaussian_eigenmatrix(
+    com, groups, inps, outs, direc, sub_names, invert):
+    """
+    MacroModel eigenmatrix using Gaussian eigenvectors (-mgeig).
+    """
+    data = []
+    filenames = chain.from_iterable(groups)
     for comma_filenames in filenames:
         name_mae, name_gau_log = comma_filenames.split(',')
         name_mae_log = inps[name_mae].name_log
@@ -1980,20 +1973,79 @@ def collect_data(coms, inps, direc='.', sub_names=['OPT'], invert=None):
             logger.warning('Eigenvectors retrieved from {}: {}'.format(
                     name_gau_log, evec.shape))
             raise
-        low_tri_idx = np.tril_indices_from(eigenmatrix)
-        low_tri = eigenmatrix[low_tri_idx]
-        data.extend([datatypes.Datum(
-                    val=e,
-                    com='mgeig',
-                    typ='eig',
-                    src_1=name_mae,
-                    src_2=name_gau_log,
-                    idx_1=x + 1,
-                    idx_2=y + 1)
-                     for e, x, y in zip(
-                    low_tri, low_tri_idx[0], low_tri_idx[1])])
-    logger.log(15, 'TOTAL DATA POINTS: {}'.format(len(data)))
-    return np.array(data, dtype=datatypes.Datum)
+        data.extend(make_eig_data(
+            eigenmatrix, 'mgeig', name_mae, src_2=name_gau_log))
+    return data
+
+# Maps each command to the function that collects its data. The order
+# matters. Data points are compared positionally within a data type, so
+# commands are always collected in this order.
+COLLECTORS = OrderedDict([
+    ('r', collect_reference_files),
+    ('mp', collect_mm3_params),
+    ('je', collect_jaguar_energies),
+    ('ge1', collect_gaussian_energies),
+    ('ge1o', collect_gaussian_energies),
+    ('ge', collect_gaussian_energies),
+    ('me', collect_macromodel_energies),
+    ('gab', collect_amber_geometry),
+    ('gaa', collect_amber_geometry),
+    ('gat', collect_amber_geometry),
+    ('gabo', collect_amber_geometry),
+    ('gaao', collect_amber_geometry),
+    ('gato', collect_amber_geometry),
+    ('abo', collect_amber_geometry),
+    ('aao', collect_amber_geometry),
+    ('ato', collect_amber_geometry),
+    ('ae1', collect_amber_energies),
+    ('ae1o', collect_amber_energies),
+    ('ah', collect_amber_hessian),
+    ('jea', collect_jaguar_energies),
+    ('gea', collect_gaussian_energies),
+    ('mea', collect_macromodel_energies),
+    ('jeo', collect_jaguar_energies),
+    ('geo', collect_gaussian_energies),
+    ('meo', collect_macromodel_energies),
+    ('jeao', collect_jaguar_energies),
+    ('geao', collect_gaussian_energies),
+    ('meao', collect_macromodel_energies),
+    ('jb', collect_mae_geometry),
+    ('gtb', collect_tinker_geometry),
+    ('gta', collect_tinker_geometry),
+    ('gtt', collect_tinker_geometry),
+    ('tb', collect_tinker_geometry),
+    ('ta', collect_tinker_geometry),
+    ('tt', collect_tinker_geometry),
+    ('tbo', collect_tinker_geometry),
+    ('tao', collect_tinker_geometry),
+    ('tto', collect_tinker_geometry),
+    ('te', collect_tinker_energies),
+    ('tea', collect_tinker_energies),
+    ('teo', collect_tinker_energies),
+    ('teao', collect_tinker_energies),
+    ('th', collect_tinker_hessian),
+    ('tgeig', collect_tinker_gaussian_eigenmatrix),
+    ('mb', collect_mae_geometry),
+    ('ja', collect_mae_geometry),
+    ('ma', collect_mae_geometry),
+    ('jt', collect_mae_geometry),
+    ('mt', collect_mae_geometry),
+    ('jq', collect_jaguar_charges),
+    ('mq', collect_macromodel_charges),
+    ('mgESP', collect_macromodel_gaussian_esp),
+    ('mjESP', collect_macromodel_jaguar_esp),
+    ('jqh', collect_jaguar_charges_no_aliph_hyds),
+    ('mqh', collect_macromodel_charges_no_aliph_hyds),
+    ('jqa', collect_jaguar_charges_no_hyds),
+    ('mqa', collect_macromodel_charges_no_hyds),
+    ('jh', collect_jaguar_hessian),
+    ('gh', collect_gaussian_hessian),
+    ('mh', collect_macromodel_hessian),
+    ('jeigz', collect_jaguar_eigenmatrix),
+    ('geigz', collect_gaussian_eigenmatrix),
+    ('mjeig', collect_macromodel_jaguar_eigenmatrix),
+    ('mgeig', collect_macromodel_gaussian_eigenmatrix)])
+
 
 def collect_data_fake(coms, inps, direc='.', sub_names=['OPT']):
     """
@@ -2023,11 +2075,8 @@ def flatten(l):
     This goes a bit further than chain.from_iterable in that it can deal with
     an arbitrary number of nested lists.
     """
-    # Move this?
-    import collections
     for el in l:
-        if isinstance(el, collections.Iterable) and \
-          not isinstance(el, str):
+        if isinstance(el, Iterable) and not isinstance(el, str):
             for sub in flatten(el):
                 yield sub
         else:
@@ -2080,7 +2129,7 @@ def collect_structural_data_from_tinker_log(
     # hes_structure.natoms = num_atoms
     # hessian = hes_structure.hessian()
     # Stuff to try out hessian.
-    if com in ['te','teo','tea','teao']:
+    if com in COM_TINKER_ENERGY:
         energy = struct.props['energy']
         new_datum = (datatypes.Datum(
             val=energy,
@@ -2140,7 +2189,7 @@ def collect_structural_data_from_amber_ene(
         struct = log_structure[0]
     else:
         struct = log_structure[select_struct[ind]]
-    if com in ['ae','aeo','aea','aeao','ae1','ae1o']:
+    if com in COM_AMBER_ENERGY:
         energy = struct.props['energy']
         new_datum = (datatypes.Datum(
             val=energy,
@@ -2157,6 +2206,28 @@ def collect_structural_data_from_amber_ene(
 
 
 
+def return_input_paths(args):
+    """
+    Returns the paths of the files that calculate reads for the given
+    arguments (the files given to each command).
+
+    Arguments
+    ---------
+    args : string or list of strings
+           Same as for main().
+
+    Returns
+    -------
+    list of strings
+    """
+    if isinstance(args, str):
+        args = args.split()
+    opts = return_calculate_parser().parse_args(args)
+    commands = {key: value for key, value in opts.__dict__.items() if key
+                in COM_ALL and value}
+    return [os.path.join(opts.directory, filename)
+            for filename in sort_commands_by_filename(commands)]
+
 def sort_commands_by_filename(commands):
     '''
     Takes a dictionary of commands like...
@@ -2188,15 +2259,12 @@ def sort_commands_by_filename(commands):
     -------
     dictionary of the sorted commands
     '''
-    sorted_commands = {}
+    sorted_commands = defaultdict(list)
     for command, groups_filenames in commands.items():
         for comma_separated in chain.from_iterable(groups_filenames):
             for filename in comma_separated.split(','):
-                if filename in sorted_commands:
-                    sorted_commands[filename].append(command)
-                else:
-                    sorted_commands[filename] = [command]
-    return sorted_commands
+                sorted_commands[filename].append(command)
+    return dict(sorted_commands)
 
 # Will also have to be updated. Maybe the Datum class too and how it responds
 # to assigning labels. 
@@ -2247,13 +2315,46 @@ def lbl_to_data_attrs(datum, lbl):
     idxs = idxs.split('-')
     datum.idx_1 = int(idxs[0])
     if len(idxs) == 2:
-        datum.idx_2 == int(idxs[1])
+        datum.idx_2 = int(idxs[1])
 
 # Right now, this only looks good if the logger doesn't append each log
 # message with something (module, date/time, etc.).
 # It would be great if this output looked good regardless of the settings
 # used for the logger.
-# That goes for all of these pretty output functions that use TextWrapper.
+# That goes for all of these pretty output functions that use wrap_words.
+def wrap_words(words, initial_indent, subsequent_indent, width=48):
+    """
+    Fills lines up to the given width with words, like textwrap, but without
+    splitting any of the words.
+
+    Arguments
+    ---------
+    words : list of strings
+    initial_indent : string
+                     Starts the first line.
+    subsequent_indent : string
+                        Starts every line after the first.
+    width : int
+            Lines are kept to this length unless a single word doesn't fit.
+
+    Returns
+    -------
+    string
+    """
+    lines = []
+    line = None
+    for word in words:
+        if line is None:
+            line = initial_indent + word
+        elif len(line) + 1 + len(word) <= width:
+            line += ' ' + word
+        else:
+            lines.append(line)
+            line = subsequent_indent + word
+    if line is not None:
+        lines.append(line)
+    return '\n'.join(lines)
+
 def pretty_commands_for_files(commands_for_files, log_level=5):
     """
     Logs the .mae commands dictionary, or the all of the commands
@@ -2264,17 +2365,15 @@ def pretty_commands_for_files(commands_for_files, log_level=5):
     commands_for_files : dic
     log_level : int
     """
-    if logger.getEffectiveLevel() <= log_level:
-        foobar = TextWrapper(
-            width=48, subsequent_indent=' '*26)
+    if logger.isEnabledFor(log_level):
         logger.log(
             log_level,
             '--' + ' FILENAME '.center(22, '-') +
             '--' + ' COMMANDS '.center(22, '-') +
             '--')
         for filename, commands in commands_for_files.items():
-            foobar.initial_indent = '  {:22s}  '.format(filename)
-            logger.log(log_level, foobar.fill(' '.join(commands)))
+            logger.log(log_level, wrap_words(
+                    commands, '  {:22s}  '.format(filename), ' '*26))
         logger.log(log_level, '-'*50)
 
 def pretty_all_commands(commands, log_level=5):
@@ -2287,8 +2386,7 @@ def pretty_all_commands(commands, log_level=5):
     commands : dic
     log_level : int
     """
-    if logger.getEffectiveLevel() <= log_level:
-        foobar = TextWrapper(width=48, subsequent_indent=' '*24)
+    if logger.isEnabledFor(log_level):
         logger.log(log_level, '')
         logger.log(
             log_level,
@@ -2299,14 +2397,16 @@ def pretty_all_commands(commands, log_level=5):
         for command, groups_filenames in commands.items():
             for i, filenames in enumerate(groups_filenames):
                 if i == 0:
-                    foobar.initial_indent = \
-                        '  {:9s}  {:^9d}  '.format(command, i+1)
+                    indent = '  {:9s}  {:^9d}  '.format(command, i+1)
                 else:
-                    foobar.initial_indent = \
-                        '  ' + ' '*9 + '  ' + '{:^9d}  '.format(i+1)
-                logger.log(log_level, foobar.fill(' '.join(filenames)))
+                    indent = '  ' + ' '*9 + '  ' + '{:^9d}  '.format(i+1)
+                logger.log(log_level, wrap_words(filenames, indent, ' '*24))
         logger.log(log_level, '-'*50)
 
+# Columns of the table logged by pretty_data.
+PRETTY_DATA_LBL = '  %-22s'
+PRETTY_DATA_NUM = '  %22.4f'
+
 def pretty_data(data, log_level=20):
     """
     Logs data as a table.
@@ -2319,26 +2419,26 @@ def pretty_data(data, log_level=20):
     # Really, this should check every data point instead of only the 1st.
     if not data[0].wht:
         compare.import_weights(data)
+    # Don't bother formatting rows that the logger would throw away.
+    if log_level and not logger.isEnabledFor(log_level):
+        return
+    # Each column is formatted all at once, then the weights are left out
+    # for the data that doesn't have any.
+    table = datatypes.DatumArray(data)
+    lbls = np.char.mod(PRETTY_DATA_LBL, table.lbls)
+    vals = np.char.mod(PRETTY_DATA_NUM, table.vals)
+    whts = np.where(
+        np.isnan(table.whts), '', np.char.mod(PRETTY_DATA_NUM, table.whts))
+    rows = np.char.add(np.char.add(lbls, whts), vals).tolist()
+    # The whole table goes to the logger in one message.
     if log_level:
         string = ('--' + ' LABEL '.center(22, '-') +
                   '--' + ' WEIGHT '.center(22, '-') +
                   '--' + ' VALUE '.center(22, '-') +
                   '--')
-        logger.log(log_level, string)
-    for d in data:
-        if d.wht or d.wht == 0:
-            string = ('  ' + '{:22s}'.format(d.lbl) +
-                      '  ' + '{:22.4f}'.format(d.wht) +
-                      '  ' + '{:22.4f}'.format(d.val))
-        else:
-            string = ('  ' + '{:22s}'.format(d.lbl) +
-                      '  ' + '{:22.4f}'.format(d.val))
-        if log_level:
-            logger.log(log_level, string)
-        else:
-            print(string)
-    if log_level:
-        logger.log(log_level, '-' * 50)
+        logger.log(log_level, '\n'.join([string] + rows + ['-' * 50]))
+    else:
+        print('\n'.join(rows))
 
 if __name__ == '__main__':
     logging.config.dictConfig(co.LOG_SETTINGS)
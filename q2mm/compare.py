@@ -151,20 +151,8 @@ def compare_data(r_dict, c_dict, output=None, doprint=False):
         if typ in ['e','eo','ea','eao']:
             correlate_energies(r_dict[typ],c_dict[typ])
         import_weights(r_dict[typ])
-        for r,c in zip(r_dict[typ],c_dict[typ]):
-            if c.typ == 't':
-                diff = abs(r.val - c.val)
-                if diff > 180.:
-                    diff = 360. - diff
-            else:
-                diff = r.val - c.val
-            #score = (r.wht**2 * diff**2)
-            if typ in ['e', 'eo', 'ea', 'eao']:
-                score = (r.wht**2 * diff**2)/total_num_energy
-            elif typ == "h":
-                score = (c.wht**2 * diff**2)/len(c_dict[typ])
-            else:
-                score = (r.wht**2 * diff**2)/len(r_dict[typ])
+        scores = score_type(r_dict[typ], c_dict[typ], typ, total_num_energy)
+        for r, c, score in zip(r_dict[typ], c_dict[typ], scores.tolist()):
             score_tot += score
             score_typ[c.typ] += score
             num_typ[c.typ] += 1
@@ -196,15 +184,53 @@ def compare_data(r_dict, c_dict, output=None, doprint=False):
     strings.append('-' * 89)
     for k, v in score_typ.items():
         strings.append('{:<20} {:20.4f}'.format(k + ':', v))
+    # Joined once rather than writing or printing line by line.
+    text = '\n'.join(strings) + '\n'
     if output:
         with open(output, 'w') as f:
-            for line in strings:
-                f.write('{}\n'.format(line))
+            f.write(text)
     if doprint:
-        for line in strings:
-            print(line)
+        print(text, end='')
     return score_tot
 
+def score_type(r_data, c_data, typ, total_num_energy):
+    """
+    Scores every data point of a single data type at once.
+
+    Arguments
+    ---------
+    r_data : list of `datatypes.Datum`
+             Reference data, with weights already imported.
+    c_data : list of `datatypes.Datum`
+             Calculated data, aligned with `r_data`.
+    typ : string
+          Data type shared by `r_data` and `c_data`.
+    total_num_energy : int
+                       Number of energy data points across all energy types.
+
+    Returns
+    -------
+    numpy.ndarray of the score for each pair of data points.
+    """
+    pairs = list(zip(r_data, c_data))
+    r_vals = np.array([r.val for r, c in pairs], dtype=float)
+    c_vals = np.array([c.val for r, c in pairs], dtype=float)
+    if typ == 't':
+        diff = np.abs(r_vals - c_vals)
+        diff = np.where(diff > 180., 360. - diff, diff)
+    else:
+        diff = r_vals - c_vals
+    if typ in ['e', 'eo', 'ea', 'eao']:
+        whts = np.array([r.wht for r, c in pairs], dtype=float)
+        num = total_num_energy
+    elif typ == 'h':
+        whts = np.array([c.wht for r, c in pairs], dtype=float)
+        num = len(c_data)
+    else:
+        whts = np.array([r.wht for r, c in pairs], dtype=float)
+        num = len(r_data)
+    return (whts**2 * diff**2) / num
+
 def return_compare_parser():
     """
     Arguments parser for compare.
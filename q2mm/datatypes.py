@@ -10,7 +10,6 @@ import logging
 import numpy as np
 import os
 import re
-import sys
 
 import constants as co
 import filetypes
@@ -97,16 +96,10 @@ class Param(object):
                     "{} doesn't have a default step size and none "
                     "provided!".format(self))
                 raise
-        if sys.version_info > (3, 0):
-            if isinstance(self._step, str):
-                return float(self._step) * self.value
-            else:
-                return self._step
+        if isinstance(self._step, str):
+            return float(self._step) * self.value
         else:
-            if isinstance(self._step, basestring):
-                return float(self._step) * self.value
-            else:
-                return self._step
+            return self._step
     @step.setter
     def step(self, x):
         self._step = x
@@ -223,8 +216,26 @@ class Datum(object):
             self._lbl = '_'.join(abcd)
         return self._lbl
 
+class DatumArray(object):
+    '''
+    Labels, weights and values of a sequence of Datum, stored as parallel
+    numpy arrays so that they can be used all at once. Missing weights are
+    stored as NaN.
+    '''
+    __slots__ = ['lbls', 'whts', 'vals']
+    def __init__(self, data):
+        num = len(data)
+        self.lbls = np.array([datum.lbl for datum in data], dtype=str)
+        self.whts = np.fromiter(
+            (np.nan if datum.wht is None else datum.wht for datum in data),
+            dtype=float, count=num)
+        self.vals = np.fromiter(
+            (datum.val for datum in data), dtype=float, count=num)
+    def __len__(self):
+        return len(self.vals)
+
 def remove_none(*args):
-    return [x for x in args if (x is not None and x is not '')]
+    return [x for x in args if (x is not None and x != '')]
 
 def datum_sort_key(datum):
     '''
@@ -23,6 +23,7 @@ from __future__ import division
 
 from argparse import RawTextHelpFormatter
 from string import digits
+import hashlib
 import logging
 import mmap
 import numpy as np
@@ -32,6 +33,8 @@ import re
 import subprocess as sp
 import time
 import sys
+import threading
+import zipfile
 
 try:
     from schrodinger import structure as sch_str
@@ -51,6 +54,15 @@ logger = logging.getLogger(__name__)
 # np.set_printoptions(threshold=np.nan)
 np.set_printoptions(threshold=sys.maxsize)
 
+# Arrays parsed from large text files (ex. Gaussian Hessians) are saved here,
+# in a subdirectory next to the original file, so that they don't have to be
+# parsed again every time the same file is used.
+CACHE_DIRNAME = '.q2mm_cache'
+# Number of MacroModel jobs started after checking for Schrodinger tokens that
+# haven't finished yet, and the lock used to check and update it. See Mae.run.
+MACROMODEL_JOBS = 0
+MACROMODEL_LOCK = threading.Lock()
+
 class File(object):
     """
     Base for every other filetype class.
@@ -75,6 +87,78 @@ class File(object):
             for line in lines:
                 f.write(line)
 
+def hash_sources(modules):
+    """
+    Returns a hash of the source files of the given modules.
+    """
+    source_hash = hashlib.blake2b(digest_size=20)
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            source_hash.update(f.read())
+    return source_hash.hexdigest()
+
+# Hash of the code that parses the cached arrays. Arrays cached by a
+# different version of it are parsed again.
+CACHE_SOURCE_HASH = hash_sources([co, sys.modules[__name__]])
+
+def cache_path(path):
+    """
+    Returns the path of the cache file used for the file at path.
+    """
+    return os.path.join(
+        os.path.dirname(path), CACHE_DIRNAME, os.path.basename(path) + '.npz')
+
+def load_cache(path, names):
+    """
+    Loads arrays that were cached for the file at path.
+
+    Arguments
+    ---------
+    path : string
+           Path of the original file, not the cache.
+    names : list of strings
+            Names of the arrays that are needed.
+
+    Returns
+    -------
+    dictionary of numpy arrays or None if the cache doesn't exist, is older
+    than the file, was written by different code or is missing any of the
+    arrays
+    """
+    path_cache = cache_path(path)
+    try:
+        if os.path.getmtime(path_cache) < os.path.getmtime(path):
+            return None
+        with np.load(path_cache) as npz:
+            if 'source_hash' not in npz.files or \
+                    str(npz['source_hash']) != CACHE_SOURCE_HASH:
+                return None
+            if not all(name in npz.files for name in names):
+                return None
+            cached = {name: npz[name] for name in names}
+    # A truncated or corrupt cache is just read again from the file.
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+        return None
+    logger.log(5, 'READING: {}'.format(path_cache))
+    return cached
+
+def save_cache(path, **arrays):
+    """
+    Caches arrays read from the file at path, along with
+    CACHE_SOURCE_HASH. Failing to write the cache isn't an error, it just
+    means the file is parsed again next time.
+    """
+    path_cache = cache_path(path)
+    try:
+        if not os.path.isdir(os.path.dirname(path_cache)):
+            os.makedirs(os.path.dirname(path_cache))
+        # Write to a temporary file first so that a partially written cache
+        # is never loaded.
+        path_temp = '{}.{}.tmp.npz'.format(path_cache, os.getpid())
+        np.savez(path_temp, source_hash=CACHE_SOURCE_HASH, **arrays)
+        os.replace(path_temp, path_cache)
+    except OSError as e:
+        logger.warning('Unable to write cache for {}: {}'.format(path, e))
 
 # Currently only for 1 system.
 # 
@@ -1355,22 +1439,14 @@ class GaussFormChk(File):
             self.read_self()
         return self._hess
     def read_self(self):
-        logger.log(5, 'READING: {}'.format(self.filename))
-        stuff = re.search(
-            'Atomic numbers\s+I\s+N=\s+(?P<num_atoms>\d+)'
-            '\n\s+(?P<anums>.*?)'
-            'Nuclear charges.*?Current cartesian coordinates.*?\n(?P<coords>.*?)'
-            'Force Field'
-            '.*?Real atomic weights.*?\n(?P<masses>.*?)'
-            'Atom fragment info.*?Cartesian Gradient.*?\n(?P<evals>.*?)'
-            'Cartesian Force Constants.*?\n(?P<hess>.*?)'
-            'Dipole Moment',
-            open(self.path, 'r').read(), flags=re.DOTALL)
-        anums = [int(x) for x in stuff.group('anums').split()]
-        masses = [float(x) for x in stuff.group('masses').split()]
-        coords = [float(x) for x in stuff.group('coords').split()]
-        coords = [coords[i:i+3] for i in range(0, len(coords), 3)]
-        for anum, mass, coord in zip(anums, masses, coords):
+        cached = load_cache(
+            self.path, ['anums', 'masses', 'coords', 'evals', 'low_tri'])
+        if cached is None:
+            cached = self.read_arrays()
+            save_cache(self.path, **cached)
+        for anum, mass, coord in zip(cached['anums'].tolist(),
+                                     cached['masses'].tolist(),
+                                     cached['coords'].tolist()):
             self.atoms.append(
                 Atom(
                     atomic_num = anum,
@@ -1378,18 +1454,49 @@ class GaussFormChk(File):
                     exact_mass = mass)
                 )
         logger.log(5, '  -- Read {} atoms.'.format(len(self.atoms)))
-        self.evals = np.array(
-            [float(x) for x in stuff.group('evals').split()], dtype=float)
+        self.evals = cached['evals']
         logger.log(5, '  -- Read {} eigenvectors.'.format(len(self.evals)))
-        self.low_tri = np.array(
-            [float(x) for x in stuff.group('hess').split()], dtype=float)
-        one_dim = len(anums) * 3
+        self.low_tri = cached['low_tri']
+        one_dim = len(self.atoms) * 3
         self._hess = np.empty([one_dim, one_dim], dtype=float)
         self._hess[np.tril_indices_from(self._hess)] = self.low_tri
         self._hess += np.tril(self._hess, -1).T
         # Convert to MacroModel units.
         self._hess *= co.HESSIAN_CONVERSION
         logger.log(5, '  -- Read {} Hessian.'.format(self._hess.shape))
+    def read_arrays(self):
+        """
+        Parses the atomic numbers, masses, coordinates, eigenvalues and lower
+        triangle of the Hessian from the text of the file.
+
+        Returns
+        -------
+        dictionary of numpy arrays
+        """
+        logger.log(5, 'READING: {}'.format(self.filename))
+        stuff = re.search(
+            'Atomic numbers\s+I\s+N=\s+(?P<num_atoms>\d+)'
+            '\n\s+(?P<anums>.*?)'
+            'Nuclear charges.*?Current cartesian coordinates.*?\n(?P<coords>.*?)'
+            'Force Field'
+            '.*?Real atomic weights.*?\n(?P<masses>.*?)'
+            'Atom fragment info.*?Cartesian Gradient.*?\n(?P<evals>.*?)'
+            'Cartesian Force Constants.*?\n(?P<hess>.*?)'
+            'Dipole Moment',
+            open(self.path, 'r').read(), flags=re.DOTALL)
+        return {
+            'anums': np.array(
+                [int(x) for x in stuff.group('anums').split()], dtype=int),
+            'masses': np.array(
+                [float(x) for x in stuff.group('masses').split()],
+                dtype=float),
+            'coords': np.array(
+                [float(x) for x in stuff.group('coords').split()],
+                dtype=float).reshape(-1, 3),
+            'evals': np.array(
+                [float(x) for x in stuff.group('evals').split()], dtype=float),
+            'low_tri': np.array(
+                [float(x) for x in stuff.group('hess').split()], dtype=float)}
 
 class GaussLog(File):
     """
@@ -1407,13 +1514,33 @@ class GaussLog(File):
     @property
     def evecs(self):
         if self._evecs is None:
-            self.read_out()
+            self.read_freqs()
         return self._evecs
     @property
     def evals(self):
         if self._evals is None:
-            self.read_out()
+            self.read_freqs()
         return self._evals
+    def read_freqs(self):
+        """
+        Reads the force constants and eigenvectors, using the cache from an
+        earlier read of the same file when it's up to date.
+        """
+        cached = load_cache(self.path, ['evals', 'evecs'])
+        if cached is None:
+            self.read_out()
+            # Nothing is cached if no frequency data was found.
+            if isinstance(self._evecs, np.ndarray):
+                save_cache(self.path, evals=self._evals, evecs=self._evecs)
+        else:
+            self.set_freqs(cached['evals'], cached['evecs'])
+    def set_freqs(self, evals, evecs):
+        """
+        Sets force constants and eigenvectors that were already read from
+        this file (ex. by another process).
+        """
+        self._evals = evals
+        self._evecs = evecs
     @property
     def structures(self):
         if self._structures is None:
@@ -2669,71 +2796,90 @@ class Mae(SchrodingerFile):
                   tokens.
         """
         #print("Run " + str(self.filename) + " with commands:" + str(self.commands))
-        current_directory = os.getcwd()
-        os.chdir(self.directory)
+        # MacroModel is run from self.directory using the cwd argument rather
+        # than os.chdir. Changing the working directory would affect every
+        # thread, and calculate may run several of these at once.
+        global MACROMODEL_JOBS
         current_timeout = 0
         current_fails = 0
         licenses_available = False
+        # Whether this job counts towards MACROMODEL_JOBS.
+        reserved = False
         if check_tokens is True:
             logger.log(5, "  -- Checking Schrodinger tokens.")
             while True:
-                token_string = sp.check_output(
-                    '$SCHRODINGER/utilities/licutil -available', shell=True)
-                if (sys.version_info > (3, 0)):
-                  token_string = token_string.decode("utf-8")
-                if 'SUITE' not in token_string:
-                    licenses_available = True
-                    break
-                suite_tokens = co.LIC_SUITE.search(token_string)
-                macro_tokens = co.LIC_MACRO.search(token_string)
-                #suite_tokens = re.search(co.LIC_SUITE, token_string)
-                #macro_tokens = re.search(co.LIC_MACRO, token_string)
-                if not suite_tokens or not macro_tokens:
-                    raise Exception(
-                        'The command "$SCHRODINGER/utilities/licutil '
-                        '-available" is not working with the current '
-                        'regex in calculate.py.\nOUTPUT:\n{}'.format(
-                            token_string))
-                suite_tokens = int(suite_tokens.group(1))
-                macro_tokens = int(macro_tokens.group(1))
-                if suite_tokens > co.MIN_SUITE_TOKENS and \
-                        macro_tokens > co.MIN_MACRO_TOKENS:
-                    licenses_available = True
-                    break
-                else:
-                    if max_timeout is not None and \
-                            current_timeout > max_timeout:
-                        pretty_timeout(
-                            current_timeout, suite_tokens,
-                            macro_tokens, end=True, name_com=self.name_com)
+                # Checking the tokens and reserving them for this job happens
+                # under the lock, so that jobs started at the same time (see
+                # calculate.run_macromodel) don't all count the same free
+                # tokens.
+                with MACROMODEL_LOCK:
+                    token_string = sp.check_output(
+                        '$SCHRODINGER/utilities/licutil -available',
+                        shell=True)
+                    if (sys.version_info > (3, 0)):
+                      token_string = token_string.decode("utf-8")
+                    if 'SUITE' not in token_string:
+                        licenses_available = True
+                        break
+                    suite_tokens = co.LIC_SUITE.search(token_string)
+                    macro_tokens = co.LIC_MACRO.search(token_string)
+                    #suite_tokens = re.search(co.LIC_SUITE, token_string)
+                    #macro_tokens = re.search(co.LIC_MACRO, token_string)
+                    if not suite_tokens or not macro_tokens:
                         raise Exception(
-                            "Not enough tokens to run {}. Waited {} seconds "
-                            "before giving up.".format(
-                                self.name_com, current_timeout))
-                    pretty_timeout(current_timeout, suite_tokens, macro_tokens,
-                                   name_com=self.name_com)
-                    current_timeout += timeout
-                    time.sleep(timeout)
+                            'The command "$SCHRODINGER/utilities/licutil '
+                            '-available" is not working with the current '
+                            'regex in calculate.py.\nOUTPUT:\n{}'.format(
+                                token_string))
+                    suite_tokens = int(suite_tokens.group(1))
+                    macro_tokens = int(macro_tokens.group(1))
+                    # Jobs that are already running may not have taken their
+                    # tokens yet, so they're kept in reserve too.
+                    if suite_tokens > co.MIN_SUITE_TOKENS + MACROMODEL_JOBS \
+                            and macro_tokens > \
+                            co.MIN_MACRO_TOKENS + MACROMODEL_JOBS:
+                        MACROMODEL_JOBS += 1
+                        reserved = True
+                        licenses_available = True
+                        break
+                if max_timeout is not None and \
+                        current_timeout > max_timeout:
+                    pretty_timeout(
+                        current_timeout, suite_tokens,
+                        macro_tokens, end=True, name_com=self.name_com)
+                    raise Exception(
+                        "Not enough tokens to run {}. Waited {} seconds "
+                        "before giving up.".format(
+                            self.name_com, current_timeout))
+                pretty_timeout(current_timeout, suite_tokens, macro_tokens,
+                               name_com=self.name_com)
+                current_timeout += timeout
+                time.sleep(timeout)
         else:
             licenses_available = True
         if licenses_available:
-            while True:
-                try:
-                    logger.log(5, 'RUNNING: {}'.format(self.name_com))
-                    sp.check_output(
-                        '$SCHRODINGER/bmin -WAIT {}'.format(
-                            os.path.splitext(self.name_com)[0]), shell=True)
-                    break
-                except sp.CalledProcessError:
-                    logger.warning('Call to MacroModel failed and I have no '
-                                   'idea why!')
-                    current_fails += 1
-                    if current_fails < max_fails:
-                        time.sleep(timeout)
-                        continue
-                    else:
-                        raise
-        os.chdir(current_directory)
+            try:
+                while True:
+                    try:
+                        logger.log(5, 'RUNNING: {}'.format(self.name_com))
+                        sp.check_output(
+                            '$SCHRODINGER/bmin -WAIT {}'.format(
+                                os.path.splitext(self.name_com)[0]),
+                            shell=True, cwd=self.directory)
+                        break
+                    except sp.CalledProcessError:
+                        logger.warning('Call to MacroModel failed and I have '
+                                       'no idea why!')
+                        current_fails += 1
+                        if current_fails < max_fails:
+                            time.sleep(timeout)
+                            continue
+                        else:
+                            raise
+            finally:
+                if reserved:
+                    with MACROMODEL_LOCK:
+                        MACROMODEL_JOBS -= 1
 
 def pretty_timeout(current_timeout, macro_tokens, suite_tokens, end=False,
                    level=10, name_com=None):
@@ -3052,6 +3198,13 @@ class Structure(object):
         Returns atomic coordinates as a list of lists.
         """
         return [atom.coords for atom in self.atoms]
+    @property
+    def partial_charges(self):
+        """
+        Returns atomic partial charges as a numpy array.
+        """
+        return np.array([atom.partial_charge for atom in self.atoms],
+                        dtype=float)
     def format_coords(self, format='latex', indices_use_charge=None):
         """
         Returns a list of strings/lines to easily generate coordinates
@@ -4,25 +4,41 @@ from __future__ import absolute_import
 from __future__ import division
 
 import argparse
+import copy
 import glob
+import hashlib
 import logging
 import logging.config
 import numpy as np
 import os
+import pickle
 import random
 import sys
 import re
+from concurrent.futures import ThreadPoolExecutor
 
 import calculate
 import compare
 import constants as co
 import datatypes
+import filetypes
 import gradient
-import opt
 import parameters
 import simplex
 
 logger = logging.getLogger(__name__)
+# Force fields already read using FFLD, keyed by the class, path and
+# modification time of the file. The parameters are changed during the
+# optimization, so copies of these are used rather than the originals.
+FF_CACHE = {}
+# Reference data already calculated using RDAT, keyed by ref_data_key. That
+# covers the arguments, the files they use and the FF if it's needed.
+# Weights aren't included since they can be changed using WGHT. The data is
+# also pickled to the cache directory so that later runs can use it.
+REF_DATA_CACHE = {}
+# Commands that may run while the reference data from RDAT is still being
+# calculated. Anything else waits for the reference data first.
+COM_WITH_RDAT = frozenset(['CDAT', 'DIR', 'PARM'])
 
 class Loop(object):
     def __init__(self):
@@ -35,6 +51,25 @@ class Loop(object):
         self.args_ref = None
         self.loop_lines = None
         self.ref_data = None
+        # Reference data from RDAT that is still being calculated.
+        self.ref_data_future = None
+        # Set above 1 to calculate the reference and FF data at the same time.
+        self.threads = 1
+        # Methods that run each loop command. Each takes the command's line,
+        # its columns, all of the lines and the index of the next line, and
+        # returns the index of the next line to run.
+        self.handlers = {
+            'DIR': self.run_dir,
+            'FFLD': self.run_ffld,
+            'PARM': self.run_parm,
+            'LOOP': self.run_loop,
+            'RDAT': self.run_rdat,
+            'CDAT': self.run_cdat,
+            'COMP': self.run_comp,
+            'GRAD': self.run_grad,
+            'SIMP': self.run_simp,
+            'WGHT': self.run_wght,
+            'STEP': self.run_step}
     def opt_loop(self):
         """
         Iterator for cycling through optimization methods.
@@ -55,16 +90,23 @@ class Loop(object):
                 'input file! Calculating FF score automatically to compensate.')
             self.ff.score = compare.compare_data(
                 self.ref_data, self.ff.data)
+        # Always runs at least one cycle. Stops early once the score reaches
+        # zero since it can't improve any further.
         while last_score is None \
                 or change is None \
-                or change > self.convergence:
+                or (change > self.convergence and self.ff.score != 0.):
             self.cycle_num += 1
             last_score = self.ff.score
             self.ff = self.run_loop_input(
                 self.loop_lines, score=self.ff.score)
             logger.log(1, '>>> last_score: {}'.format(last_score))
             logger.log(1, '>>> self.ff.score: {}'.format(self.ff.score))
-            change = (last_score - self.ff.score) / last_score
+            # Avoids dividing by zero if the loop started with a score of
+            # zero.
+            if last_score == 0.:
+                change = 0.
+            else:
+                change = (last_score - self.ff.score) / last_score
             pretty_loop_summary(
                 self.cycle_num, self.ff.score, change)
             # MM3* specific. Will have to be changed soon to allow for expansion
@@ -86,312 +128,615 @@ class Loop(object):
             param.value_at_limits()
         return self.ff
     def run_loop_input(self, lines, score=None):
-        lines_iterator = iter(lines)
-        while True:
-            try:
-                line = next(lines_iterator)
-            except StopIteration:
-                return self.ff
-            cols = line.split()
-            if cols[0] == 'DIR':
-                self.direc = cols[1]
-            if cols[0] == 'FFLD':
-                # Import FF data.
-                if cols[1] == 'read':
-                    if cols[2] == 'mm3.fld':
-                        self.ff = datatypes.MM3(os.path.join(self.direc, 
-                                                             cols[2]))
-                    if 'prm' in line:
-                        self.ff = datatypes.TinkerFF(os.path.join(self.direc,
-                                                                  cols[2]))
-                    if 'frcmod' in line:
-                        self.ff = datatypes.AmberFF(os.path.join(self.direc,
-                                                                cols[2]))
-                    self.ff.import_ff()
-                    self.ff.method = 'READ'
-                    with open(os.path.join(self.direc, cols[2]), 'r') as f:
-                        self.ff.lines = f.readlines()
-                # Export FF data.
-                if cols[1] == 'write':
-                    self.ff.export_ff(os.path.join(self.direc, cols[2]))
-            # Trim parameters.
-            if cols[0] == 'PARM':
-                logger.log(20, '~~ SELECTING PARAMETERS ~~'.rjust(79, '~'))
-                self.ff.params = parameters.trim_params_by_file(
-                    self.ff.params, os.path.join(self.direc, cols[1]))
-            if cols[0] == 'LOOP':
-                # Read lines that will be looped over.
-                inner_loop_lines = []
-                line = next(lines_iterator)
-                while line.split()[0] != 'END':
-                    inner_loop_lines.append(line)
-                    line = next(lines_iterator)
-                # Make loop object and populate attributes.
-                loop = Loop()
-                loop.convergence = float(cols[1])
-                loop.direc = self.direc
-                loop.ff = self.ff
-                loop.args_ff = self.args_ff
-                loop.args_ref = self.args_ref
-                loop.ref_data = self.ref_data
-                loop.loop_lines = inner_loop_lines
-                # Log commands.
-                pretty_loop_input(
-                    inner_loop_lines, name='OPTIMIZATION LOOP',
-                    score=self.ff.score)
-                # Run inner loop.
-                self.ff = loop.opt_loop()
-            # Note: Probably want to update this to append the directory given
-            #       by the new DIR command.
-            if cols[0] == 'RDAT':
-                logger.log(
-                    20, '~~ CALCULATING REFERENCE DATA ~~'.rjust(79, '~'))
-                if len(cols) > 1:
-                    self.args_ref = ' '.join(cols[1:]).split()
-                self.ref_data = opt.return_ref_data(self.args_ref)
-            if cols[0] == 'CDAT':
-                logger.log(
-                    20, '~~ CALCULATING FF DATA ~~'.rjust(79, '~'))
-                if len(cols) > 1:
-                    self.args_ff = ' '.join(cols[1:]).split()
-                self.ff.data = calculate.main(self.args_ff)
-                
-            if cols[0] == 'COMP':
-            # Deprecated
-            #    self.ff.score = compare.compare_data(
-            #        self.ref_data, self.ff.data)
-            #    if '-o' in cols:
-            #        compare.pretty_data_comp(
-            #            self.ref_data,
-            #            self.ff.data,
-            #            os.path.join(self.direc, cols[cols.index('-o') + 1]))
-            #    if '-p' in cols:
-            #        compare.pretty_data_comp(
-            #            self.ref_data,
-            #            self.ff.data,
-            #            doprint=True)
-                output = False
-                doprint = False
-                r_dict = compare.data_by_type(self.ref_data)
-                c_dict = compare.data_by_type(self.ff.data)
-                r_dict, c_dict = compare.trim_data(r_dict,c_dict)
-                if '-o' in cols:
-                    output = os.path.join(self.direc, cols[cols.index('-o') +1])
-                if '-p' in cols:
-                    doprint = True
-                self.ff.score = compare.compare_data(
-                    r_dict, c_dict, output=output, doprint=doprint)
-            if cols[0] == 'GRAD':
-                grad = gradient.Gradient(
-                    direc=self.direc,
-                    ff=self.ff,
-                    ff_lines=self.ff.lines,
-                    args_ff=self.args_ff)
-                #### Should probably just write a function instead of looping
-                #### this for every gradient method. This includes everything
-                #### between the two lines of #. TR 20180112
-                ##############################################################        
-                for col in cols[1:]:
-                    if "lstsq" in col:
-                        g_args = col.split('=')[1].split(',')
-                        for arg in g_args:
-                            if arg == "True":
-                                grad.do_lstsq=True
-                            elif arg == False:
-                                grad.do_lstsq=False
-                            if 'radii' in arg:
-                                grad.lstsq_radii = []
-                                radii_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if radii_vals == "None":
-                                    grad.lstsq_radii = None
-                                else:
-                                    for val in radii_vals:
-                                        grad.lstsq_radii.append(float(val)) 
-                            if 'cutoff' in arg:
-                                grad.lstsq_cutoff = []
-                                cutoff_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if cutoff_vals == "None":
-                                    grad.lstsq_cutoff = None
-                                else:
-                                    if len(cutoff_vals) > 2 or \
-                                        len(cutoff_vals) < 2:
-                                        raise Exception("Cutoff values must " \
-                                            "be between two numbers.")
-                                    for val in cutoff_vals:
-                                        grad.lstsq_cutoff.append(float(val))
-                    elif "newton" in col:
-                        g_args = col.split('=')[1].split(',')
-                        for arg in g_args:
-                            if arg == "True":
-                                grad.do_newton=True
-                            elif arg == False:
-                                grad.do_newton=False
-                            if 'radii' in arg:
-                                grad.newton_radii = []
-                                radii_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if radii_vals=='None':
-                                    grad.newton_radii = None
-                                else:
-                                    for val in radii_vals:
-                                        grad.newton_radii.append(float(val)) 
-                            if 'cutoff' in arg:
-                                grad.newton_cutoff = []
-                                cutoff_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if cutoff_vals=='None':
-                                    grad.newton_cutoff = None
-                                else:
-                                    if len(cutoff_vals) > 2 or \
-                                        len(cutoff_vals) < 2:
-                                        raise Exception("Cutoff values must " \
-                                            "be between two numbers.")
-                                    for val in cutoff_vals:
-                                        grad.newton_cutoff.append(float(val))
-                    elif "levenberg" in col:
-                        g_args = col.split('=')[1].split(',')
-                        for arg in g_args:
-                            if arg == "True":
-                                grad.do_levenberg=True
-                            elif arg == False:
-                                grad.do_levenberg=False
-                            if 'radii' in arg:
-                                grad.levenberg_radii = []
-                                radii_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if radii_vals=='None':
-                                    grad.levenberg_radii = None
-                                else:
-                                    for val in radii_vals:
-                                        grad.levenberg_radii.append(float(val)) 
-                            if 'cutoff' in arg:
-                                grad.levenberg_cutoff = []
-                                cutoff_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if cutoff_vals=='None':
-                                    grad.levenberg_cutoff = None
-                                else:
-                                    if len(cutoff_vals) > 2 or \
-                                        len(cutoff_vals) < 2:
-                                        raise Exception("Cutoff values must " \
-                                            "be between two numbers.")
-                                    for val in cutoff_vals:
-                                        grad.levenberg_cutoff.append(float(val))
-                            if 'factor' in arg:
-                                grad.levenberg_cutoff = []
-                                factor_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if factor_vals=='None':
-                                    grad.levenberg_factor = None
-                                else:
-                                    for val in factor_vals:
-                                        grad.levenberg_factor.append(float(val))
-                    elif "lagrange" in col:
-                        g_args = col.split('=')[1].split(',')
-                        for arg in g_args:
-                            if arg == "True":
-                                grad.do_lagrange=True
-                            elif arg == False:
-                                grad.do_lagrange=False
-                            if 'radii' in arg:
-                                grad.lagrange_radii = []
-                                radii_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if radii_vals=='None':
-                                    grad.lagrange_radii = None
-                                else:
-                                    for val in radii_vals:
-                                        grad.lagrange_radii.append(float(val)) 
-                            if 'cutoff' in arg:
-                                grad.lagrange_cutoff = []
-                                cutoff_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if cutoff_vals=='None':
-                                    grad.lagrange_cutoff = None
-                                else:
-                                    if len(cutoff_vals) > 2 or \
-                                        len(cutoff_vals) < 2:
-                                        raise Exception("Cutoff values must " \
-                                            "be between two numbers.")
-                                    for val in cutoff_vals:
-                                        grad.lagrange_cutoff.append(float(val))
-                            if 'factor' in arg:
-                                grad.lagrange_factors = []
-                                factor_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if factor_vals=='None':
-                                    grad.lagrange_factors = None
-                                else:
-                                    for val in factor_vals:
-                                        grad.lagrange_factors.append(float(val))
-                    elif "svd" in col:
-                        g_args = col.split('=')[1].split(',')
-                        for arg in g_args:
-                            if arg == "True":
-                                grad.do_svd=True
-                            elif arg == False:
-                                grad.do_svd=False
-                            if 'radii' in arg:
-                                grad.svd_radii = []
-                                radii_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if radii_vals=='None':
-                                    grad.svd_radii = None
-                                else:
-                                    for val in radii_vals:
-                                        grad.svd_radii.append(float(val)) 
-                            if 'cutoff' in arg:
-                                grad.svd_cutoff = []
-                                cutoff_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if cutoff_vals=='None':
-                                    grad.svd_cutoff = None
-                                else:
-                                    if len(cutoff_vals) > 2 or \
-                                        len(cutoff_vals) < 2:
-                                        raise Exception("Cutoff values must " \
-                                            "be between two numbers.")
-                                    for val in cutoff_vals:
-                                        grad.svd_cutoff.append(float(val))
-                            if 'factor' in arg:
-                                grad.svd_cutoff = []
-                                factor_vals = re.search(
-                                    r"\[(.+)\]",arg).group(1).split('/')
-                                if factor_vals=='None':
-                                    grad.svd_factor = None
-                                else:
-                                    for val in factor_vals:
-                                        grad.svd_factor.append(float(val))
-                    else:
-                        raise Exception("'{}' : Not Recognized".format(col))
-                ##############################################################
-                self.ff = grad.run(ref_data=self.ref_data)
-            if cols[0] == 'SIMP':
-                simp = simplex.Simplex(
-                    direc=self.direc,
-                    ff=self.ff,
-                    ff_lines=self.ff.lines,
-                    args_ff=self.args_ff)
-                for col in cols[1:]:
-                    if "max_params" in col:
-                        simp.max_params = col.split('=')[1]
-                    else:
-                        raise Exception("'{}' : Not Recognized".format(col))
-                self.ff = simp.run(r_data=self.ref_data)
-            if cols[0] == 'WGHT':
-                data_type = cols[1]
-                co.WEIGHTS[data_type] = float(cols[2])
-            if cols[0] == 'STEP':
-                param_type = cols[1]
-                co.STEPS[param_type] = float(cols[2])
+        """
+        Runs the loop commands.
+
+        Arguments
+        ---------
+        lines : list of tuples of (string, list of strings)
+                Each command line and its columns, as returned by
+                tokenize_loop_input.
+        """
+        i = 0
+        while i < len(lines):
+            line, cols = lines[i]
+            i += 1
+            handler = self.handlers.get(cols[0])
+            if handler is not None:
+                if cols[0] not in COM_WITH_RDAT and \
+                        not (cols[0] == 'FFLD' and cols[1] == 'read'):
+                    self.wait_for_ref_data()
+                i = handler(line, cols, lines, i)
+        self.wait_for_ref_data()
+        return self.ff
+    def wait_for_ref_data(self):
+        """
+        Waits for the reference data if RDAT is still calculating it.
+        """
+        if self.ref_data_future is not None:
+            self.ref_data = self.ref_data_future.result()
+            self.ref_data_future = None
+    def run_dir(self, line, cols, lines, i):
+        """
+        Sets the working directory (DIR).
+        """
+        self.direc = cols[1]
+        return i
+    def run_ffld(self, line, cols, lines, i):
+        """
+        Reads or writes the FF (FFLD).
+        """
+        # Import FF data.
+        if cols[1] == 'read':
+            ff_class = None
+            if cols[2] == 'mm3.fld':
+                ff_class = datatypes.MM3
+            if 'prm' in line:
+                ff_class = datatypes.TinkerFF
+            if 'frcmod' in line:
+                ff_class = datatypes.AmberFF
+            if ff_class is None:
+                self.ff.import_ff()
+                with open(os.path.join(self.direc, cols[2]), 'r') as f:
+                    self.ff.lines = f.readlines()
+            else:
+                self.ff = read_ff(
+                    ff_class, os.path.join(self.direc, cols[2]))
+            self.ff.method = 'READ'
+        # Export FF data.
+        if cols[1] == 'write':
+            path = os.path.join(self.direc, cols[2])
+            self.ff.export_ff(path)
+            forget_ff(path)
+        return i
+    def run_parm(self, line, cols, lines, i):
+        """
+        Trims the parameters down to those in a file (PARM).
+        """
+        logger.log(20, '~~ SELECTING PARAMETERS ~~'.rjust(79, '~'))
+        self.ff.params = parameters.trim_params_by_file(
+            self.ff.params, os.path.join(self.direc, cols[1]))
+        return i
+    def run_loop(self, line, cols, lines, i):
+        """
+        Runs the commands up to the matching END as an optimization loop
+        (LOOP). Returns the index of the line after the END.
+        """
+        # Read lines that will be looped over.
+        end = next((j for j in range(i, len(lines))
+                    if lines[j][1][0] == 'END'), None)
+        if end is None:
+            raise Exception('LOOP is missing its END.')
+        inner_loop_lines = lines[i:end]
+        # Continue after the END.
+        i = end + 1
+        # Make loop object and populate attributes.
+        loop = Loop()
+        loop.convergence = float(cols[1])
+        loop.direc = self.direc
+        loop.ff = self.ff
+        loop.args_ff = self.args_ff
+        loop.args_ref = self.args_ref
+        loop.ref_data = self.ref_data
+        loop.threads = self.threads
+        loop.loop_lines = inner_loop_lines
+        # Log commands.
+        pretty_loop_input(
+            [line for line, inner_cols in inner_loop_lines],
+            name='OPTIMIZATION LOOP', score=self.ff.score)
+        # Run inner loop.
+        self.ff = loop.opt_loop()
+        return i
+    def run_rdat(self, line, cols, lines, i):
+        """
+        Calculates the reference data (RDAT).
+
+        Note: Probably want to update this to append the directory given by
+        the new DIR command.
+        """
+        logger.log(
+            20, '~~ CALCULATING REFERENCE DATA ~~'.rjust(79, '~'))
+        if len(cols) > 1:
+            self.args_ref = cols[1:]
+        if self.threads > 1:
+            # Calculated in the background so that a following CDAT can run
+            # at the same time. Waited for by the next command that needs it.
+            executor = ThreadPoolExecutor(max_workers=1)
+            self.ref_data_future = executor.submit(
+                return_ref_data, self.args_ref, ff_path=self.ff_path())
+            executor.shutdown(wait=False)
+        else:
+            self.ref_data = return_ref_data(
+                self.args_ref, ff_path=self.ff_path())
+        return i
+    def ff_path(self):
+        """
+        Returns the path of the FF file, or None if no FF has been read.
+        """
+        if self.ff is None:
+            return None
+        return self.ff.path
+    def run_cdat(self, line, cols, lines, i):
+        """
+        Calculates the FF data (CDAT).
+        """
+        logger.log(
+            20, '~~ CALCULATING FF DATA ~~'.rjust(79, '~'))
+        if len(cols) > 1:
+            self.args_ff = cols[1:]
+        if self.ref_data_future is not None and \
+                not calculate_concurrently(self.args_ref, self.args_ff):
+            self.wait_for_ref_data()
+        self.ff.data = calculate.main(self.args_ff)
+        return i
+    def run_comp(self, line, cols, lines, i):
+        """
+        Compares the reference and FF data to score the FF (COMP).
+        """
+        # Deprecated
+        #    self.ff.score = compare.compare_data(
+        #        self.ref_data, self.ff.data)
+        #    if '-o' in cols:
+        #        compare.pretty_data_comp(
+        #            self.ref_data,
+        #            self.ff.data,
+        #            os.path.join(self.direc, cols[cols.index('-o') + 1]))
+        #    if '-p' in cols:
+        #        compare.pretty_data_comp(
+        #            self.ref_data,
+        #            self.ff.data,
+        #            doprint=True)
+        output = False
+        doprint = False
+        r_dict = compare.data_by_type(self.ref_data)
+        c_dict = compare.data_by_type(self.ff.data)
+        r_dict, c_dict = compare.trim_data(r_dict,c_dict)
+        if '-o' in cols:
+            output = os.path.join(self.direc, cols[cols.index('-o') +1])
+        if '-p' in cols:
+            doprint = True
+        self.ff.score = compare.compare_data(
+            r_dict, c_dict, output=output, doprint=doprint)
+        return i
+    def run_grad(self, line, cols, lines, i):
+        """
+        Optimizes the FF using gradient methods (GRAD).
+        """
+        grad = gradient.Gradient(
+            direc=self.direc,
+            ff=self.ff,
+            ff_lines=self.ff.lines,
+            args_ff=self.args_ff)
+        #### Should probably just write a function instead of looping
+        #### this for every gradient method. This includes everything
+        #### between the two lines of #. TR 20180112
+        ##############################################################        
+        for col in cols[1:]:
+            if "lstsq" in col:
+                g_args = col.split('=')[1].split(',')
+                for arg in g_args:
+                    if arg == "True":
+                        grad.do_lstsq=True
+                    elif arg == False:
+                        grad.do_lstsq=False
+                    if 'radii' in arg:
+                        grad.lstsq_radii = []
+                        radii_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if radii_vals == "None":
+                            grad.lstsq_radii = None
+                        else:
+                            for val in radii_vals:
+                                grad.lstsq_radii.append(float(val)) 
+                    if 'cutoff' in arg:
+                        grad.lstsq_cutoff = []
+                        cutoff_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if cutoff_vals == "None":
+                            grad.lstsq_cutoff = None
+                        else:
+                            if len(cutoff_vals) > 2 or \
+                                len(cutoff_vals) < 2:
+                                raise Exception("Cutoff values must " \
+                                    "be between two numbers.")
+                            for val in cutoff_vals:
+                                grad.lstsq_cutoff.append(float(val))
+            elif "newton" in col:
+                g_args = col.split('=')[1].split(',')
+                for arg in g_args:
+                    if arg == "True":
+                        grad.do_newton=True
+                    elif arg == False:
+                        grad.do_newton=False
+                    if 'radii' in arg:
+                        grad.newton_radii = []
+                        radii_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if radii_vals=='None':
+                            grad.newton_radii = None
+                        else:
+                            for val in radii_vals:
+                                grad.newton_radii.append(float(val)) 
+                    if 'cutoff' in arg:
+                        grad.newton_cutoff = []
+                        cutoff_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if cutoff_vals=='None':
+                            grad.newton_cutoff = None
+                        else:
+                            if len(cutoff_vals) > 2 or \
+                                len(cutoff_vals) < 2:
+                                raise Exception("Cutoff values must " \
+                                    "be between two numbers.")
+                            for val in cutoff_vals:
+                                grad.newton_cutoff.append(float(val))
+            elif "levenberg" in col:
+                g_args = col.split('=')[1].split(',')
+                for arg in g_args:
+                    if arg == "True":
+                        grad.do_levenberg=True
+                    elif arg == False:
+                        grad.do_levenberg=False
+                    if 'radii' in arg:
+                        grad.levenberg_radii = []
+                        radii_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if radii_vals=='None':
+                            grad.levenberg_radii = None
+                        else:
+                            for val in radii_vals:
+                                grad.levenberg_radii.append(float(val)) 
+                    if 'cutoff' in arg:
+                        grad.levenberg_cutoff = []
+                        cutoff_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if cutoff_vals=='None':
+                            grad.levenberg_cutoff = None
+                        else:
+                            if len(cutoff_vals) > 2 or \
+                                len(cutoff_vals) < 2:
+                                raise Exception("Cutoff values must " \
+                                    "be between two numbers.")
+                            for val in cutoff_vals:
+                                grad.levenberg_cutoff.append(float(val))
+                    if 'factor' in arg:
+                        grad.levenberg_cutoff = []
+                        factor_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if factor_vals=='None':
+                            grad.levenberg_factor = None
+                        else:
+                            for val in factor_vals:
+                                grad.levenberg_factor.append(float(val))
+            elif "lagrange" in col:
+                g_args = col.split('=')[1].split(',')
+                for arg in g_args:
+                    if arg == "True":
+                        grad.do_lagrange=True
+                    elif arg == False:
+                        grad.do_lagrange=False
+                    if 'radii' in arg:
+                        grad.lagrange_radii = []
+                        radii_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if radii_vals=='None':
+                            grad.lagrange_radii = None
+                        else:
+                            for val in radii_vals:
+                                grad.lagrange_radii.append(float(val)) 
+                    if 'cutoff' in arg:
+                        grad.lagrange_cutoff = []
+                        cutoff_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if cutoff_vals=='None':
+                            grad.lagrange_cutoff = None
+                        else:
+                            if len(cutoff_vals) > 2 or \
+                                len(cutoff_vals) < 2:
+                                raise Exception("Cutoff values must " \
+                                    "be between two numbers.")
+                            for val in cutoff_vals:
+                                grad.lagrange_cutoff.append(float(val))
+                    if 'factor' in arg:
+                        grad.lagrange_factors = []
+                        factor_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if factor_vals=='None':
+                            grad.lagrange_factors = None
+                        else:
+                            for val in factor_vals:
+                                grad.lagrange_factors.append(float(val))
+            elif "svd" in col:
+                g_args = col.split('=')[1].split(',')
+                for arg in g_args:
+                    if arg == "True":
+                        grad.do_svd=True
+                    elif arg == False:
+                        grad.do_svd=False
+                    if 'radii' in arg:
+                        grad.svd_radii = []
+                        radii_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if radii_vals=='None':
+                            grad.svd_radii = None
+                        else:
+                            for val in radii_vals:
+                                grad.svd_radii.append(float(val)) 
+                    if 'cutoff' in arg:
+                        grad.svd_cutoff = []
+                        cutoff_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if cutoff_vals=='None':
+                            grad.svd_cutoff = None
+                        else:
+                            if len(cutoff_vals) > 2 or \
+                                len(cutoff_vals) < 2:
+                                raise Exception("Cutoff values must " \
+                                    "be between two numbers.")
+                            for val in cutoff_vals:
+                                grad.svd_cutoff.append(float(val))
+                    if 'factor' in arg:
+                        grad.svd_cutoff = []
+                        factor_vals = re.search(
+                            r"\[(.+)\]",arg).group(1).split('/')
+                        if factor_vals=='None':
+                            grad.svd_factor = None
+                        else:
+                            for val in factor_vals:
+                                grad.svd_factor.append(float(val))
+            else:
+                raise Exception("'{}' : Not Recognized".format(col))
+        ##############################################################
+        self.ff = grad.run(ref_data=self.ref_data)
+        return i
+    def run_simp(self, line, cols, lines, i):
+        """
+        Optimizes the FF using the simplex method (SIMP).
+        """
+        simp = simplex.Simplex(
+            direc=self.direc,
+            ff=self.ff,
+            ff_lines=self.ff.lines,
+            args_ff=self.args_ff)
+        for col in cols[1:]:
+            if "max_params" in col:
+                simp.max_params = col.split('=')[1]
+            else:
+                raise Exception("'{}' : Not Recognized".format(col))
+        self.ff = simp.run(r_data=self.ref_data)
+        return i
+    def run_wght(self, line, cols, lines, i):
+        """
+        Changes the weight of a data type (WGHT).
+        """
+        data_type = cols[1]
+        co.WEIGHTS[data_type] = float(cols[2])
+        return i
+    def run_step(self, line, cols, lines, i):
+        """
+        Changes the step size of a parameter type (STEP).
+        """
+        param_type = cols[1]
+        co.STEPS[param_type] = float(cols[2])
+        return i
+
+def read_ff(ff_class, path):
+    """
+    Reads a force field file, along with its lines. If the same file was
+    already read and hasn't changed since, a copy of that force field is
+    returned instead of parsing the file again.
+
+    Arguments
+    ---------
+    ff_class : class
+               Ex. datatypes.MM3.
+    path : string
+
+    Returns
+    -------
+    instance of ff_class
+    """
+    key = (ff_class, os.path.abspath(path), os.path.getmtime(path))
+    if key not in FF_CACHE:
+        ff = ff_class(path)
+        ff.import_ff()
+        with open(path, 'r') as f:
+            ff.lines = f.readlines()
+        FF_CACHE[key] = ff
+    else:
+        logger.log(5, '  -- Reusing FF read from {}.'.format(path))
+    return copy.deepcopy(FF_CACHE[key])
+
+def forget_ff(path):
+    """
+    Removes force fields read from a file that has since been written over.
+    They can't be used again since their modification time is out of date.
+
+    The FF that was written can't be cached in their place. Reading the file
+    again gives every parameter rather than those selected using PARM, and
+    the values are rounded as they were written.
+    """
+    path = os.path.abspath(path)
+    for key in [key for key in FF_CACHE if key[1] == path]:
+        del FF_CACHE[key]
+
+# Hash of the modules that calculate the reference data. Reference data saved
+# to the disk by a different version of these is calculated again.
+SOURCE_HASH = filetypes.hash_sources([calculate, co, datatypes, filetypes])
+
+def return_ref_data(args_ref, ff_path=None):
+    """
+    Calculates the reference data and imports the weights for it.
+
+    The reference data only depends on the arguments and the files they use
+    (see ref_data_key), so the data is only calculated again if one of those
+    changes, including between runs.
+
+    Arguments
+    ---------
+    args_ref : list of strings
+               Arguments for calculate.
+    ff_path : string or None
+              Path of the FF used by any backend calculations.
+
+    Returns
+    -------
+    numpy.ndarray of datatypes.Datum
+    """
+    key = ref_data_key(args_ref, ff_path=ff_path)
+    if key not in REF_DATA_CACHE:
+        path_cache = ref_data_cache_path(args_ref, key)
+        ref_data = load_ref_data(path_cache)
+        if ref_data is None:
+            logger.log(20, '~~ GATHERING REFERENCE DATA ~~'.rjust(79, '~'))
+            ref_data = calculate.main(args_ref)
+            if None not in key[2]:
+                save_ref_data(path_cache, ref_data)
+        else:
+            logger.log(
+                20, '  -- Reusing reference data from {}.'.format(path_cache))
+        REF_DATA_CACHE[key] = ref_data
+    else:
+        logger.log(20, '  -- Reusing reference data calculated earlier.')
+    # Copied so that the cached data never has weights set on it.
+    ref_data = copy.deepcopy(REF_DATA_CACHE[key])
+    compare.import_weights(ref_data)
+    return ref_data
+
+def ref_data_key(args_ref, ff_path=None):
+    """
+    Returns the key used to cache the reference data.
+
+    The key holds the arguments along with the absolute paths, modification
+    times and sizes of the files used, then SOURCE_HASH. If any of the
+    commands run a backend calculation (ex. -jb runs MacroModel) or load the
+    FF, the FF file is one of those files.
+
+    Arguments
+    ---------
+    args_ref : list of strings
+               Arguments for calculate.
+    ff_path : string or None
+              Path of the FF used by any backend calculations.
+
+    Returns
+    -------
+    tuple of (tuple of strings, tuple of strings, tuple of tuples, string),
+    where the stats of files that don't exist or aren't known are None
+    """
+    opts = calculate.return_calculate_parser().parse_args(args_ref)
+    commands = set(
+        com for com in calculate.COM_ALL if getattr(opts, com, None))
+    paths = [os.path.abspath(path) for path in
+             calculate.return_input_paths(args_ref)]
+    if not calculate.COM_LOAD_FF.isdisjoint(commands) or \
+            any(not group.isdisjoint(commands)
+                for group in calculate.INPUT_CLASSES):
+        ff_paths = [path for path in (ff_path, opts.ffpath) if path]
+        if ff_paths:
+            paths.extend(os.path.abspath(path) for path in ff_paths)
+        else:
+            # The FF can't be checked, so this key never matches data
+            # saved to the disk.
+            paths.append(None)
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((stat.st_mtime, stat.st_size))
+        except (OSError, TypeError):
+            stats.append(None)
+    return (tuple(args_ref), tuple(paths), tuple(stats), SOURCE_HASH)
+
+def ref_data_cache_path(args_ref, key):
+    """
+    Returns the path of the file the reference data is pickled to. It's in
+    the cache directory of the directory given to calculate, and is named
+    using a hash of the key used for REF_DATA_CACHE.
+    """
+    directory = calculate.return_calculate_parser().parse_args(
+        args_ref).directory
+    name = hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest()
+    return os.path.join(directory, filetypes.CACHE_DIRNAME, name + '.pkl')
+
+def load_ref_data(path_cache):
+    """
+    Loads reference data pickled by an earlier run.
+
+    Returns
+    -------
+    numpy.ndarray of datatypes.Datum or None if there is no usable cache
+    """
+    try:
+        with open(path_cache, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logger.warning('Unable to read cache {}: {}'.format(path_cache, e))
+        return None
+
+def save_ref_data(path_cache, ref_data):
+    """
+    Pickles reference data for later runs. Failing to write the cache isn't
+    an error, it just means the data is calculated again next time.
+    """
+    try:
+        if not os.path.isdir(os.path.dirname(path_cache)):
+            os.makedirs(os.path.dirname(path_cache))
+        # Write to a temporary file first so that a partially written cache
+        # is never loaded.
+        path_temp = '{}.{}.tmp'.format(path_cache, os.getpid())
+        with open(path_temp, 'wb') as f:
+            pickle.dump(ref_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path_temp, path_cache)
+    except OSError as e:
+        logger.warning('Unable to write cache {}: {}'.format(path_cache, e))
+
+def calculate_concurrently(args_1, args_2):
+    """
+    Checks whether calculate can run for two sets of arguments at the same
+    time. They can't share any files, and neither can use a backend that
+    changes the working directory while it runs (Tinker, Amber or Gaussian
+    run from a .chk file), since that's shared by every thread.
+
+    Arguments
+    ---------
+    args_1 : list of strings
+    args_2 : list of strings
+
+    Returns
+    -------
+    bool
+    """
+    paths = []
+    for args in (args_1, args_2):
+        opts = calculate.return_calculate_parser().parse_args(args)
+        if any(getattr(opts, com, None) for com in calculate.COM_CHANGE_DIR):
+            return False
+        paths_args = set(os.path.abspath(path) for path in
+                         calculate.return_input_paths(args))
+        if any(path.endswith('.chk') for path in paths_args):
+            return False
+        paths.append(paths_args)
+    return not paths[0] & paths[1]
+
+def tokenize_loop_input(lines):
+    """
+    Splits each line of the loop input into columns once, so that commands
+    repeated every loop cycle don't have to be split again.
+
+    Returns
+    -------
+    list of tuples of (string, list of strings)
+    """
+    return [(line, line.split()) for line in lines]
 
 def read_loop_input(filename):
+    # Strips comments and trailing whitespace once per line, skipping lines
+    # left empty.
     with open(filename, 'r') as f:
-        lines = f.readlines()
-    lines = [x.partition('#')[0].strip('\n') for x in lines if
-             x.partition('#')[0].strip('\n') != '']
+        lines = [x for x in (y.partition('#')[0].rstrip() for y in f) if x]
     pretty_loop_input(lines)
     return lines
 
@@ -417,10 +762,15 @@ def main(args):
     parser = argparse.ArgumentParser()
     parser.add_argument(
         'input', type=str, help='Filename containing loop commands.')
+    parser.add_argument(
+        '--threads', '-t', type=int, default=1,
+        help='Use 2 to calculate the reference data (RDAT) and FF data '
+        '(CDAT) at the same time rather than one after the other.')
     opts = parser.parse_args(args)
     lines = read_loop_input(opts.input)
     loop = Loop()
-    loop.run_loop_input(lines)
+    loop.threads = opts.threads
+    loop.run_loop_input(tokenize_loop_input(lines))
 
 if __name__ == '__main__':
     # if os.path.isfile('root.log'):
@@ -296,7 +296,7 @@ def pretty_derivs(params, level=5):
     level : int
             Minimum logging level required for this to display.
     """
-    if logger.getEffectiveLevel() <= level:
+    if logger.isEnabledFor(level):
         logger.log(level,
                    '--' + ' Parameter '.ljust(33, '-') +
                    '--' + ' 1st der. '.center(19, '-') +
@@ -326,7 +326,7 @@ def pretty_ff_params(ffs, level=20):
     ffs : list of `datatypes.FF` (or subclass)
     level : int
     """
-    if logger.getEffectiveLevel() <= level:
+    if logger.isEnabledFor(level):
         wrapper = textwrap.TextWrapper(width=79, subsequent_indent=' '*29)
         logger.log(
             level,
@@ -349,7 +349,7 @@ def pretty_ff_results(ff, level=20):
     ff : `datatypes.FF` (or subclass)
     level : int
     """
-    if logger.getEffectiveLevel() <= level:
+    if logger.isEnabledFor(level):
         wrapper = textwrap.TextWrapper(width=79)
         logger.log(level, ' {} '.format(ff.method).center(79, '='))
         logger.log(level, 'SCORE: {}'.format(ff.score))
@@ -362,7 +362,7 @@ def pretty_param_changes(params, changes, method=None, level=20):
     """
     Shows some parameter changes.
     """
-    if logger.getEffectiveLevel() <= level:
+    if logger.isEnabledFor(level):
         if method:
             logger.log(level, ' {} '.format(method).center(79, '='))
         else:
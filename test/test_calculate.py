@@ -2,12 +2,15 @@ from __future__ import print_function
 import copy
 import logging
 import logging.config
+import numpy as np
 import os
 import unittest
+from types import SimpleNamespace
 
 import constants as co
 import calculate
 import compare
+import filetypes
 
 logger = logging.getLogger(__name__)
 
@@ -196,7 +199,155 @@ class TestCompareBonds(unittest.TestCase):
     def test_compare_bonds(self):
         score = compare.compare_data(self.r_conn, self.f_conn)
         print('COMPARE BONDS SCORE: {}'.format(score))
-            
+
+class TestMakeEigData(unittest.TestCase):
+    """
+    Check that eigenmatrix data points are made for every element in the
+    lower triangle, including the zeroed off-diagonal elements.
+    """
+    def setUp(self):
+        self.evals = np.array([-1., 2., 3., 4.])
+    def test_diag_only(self):
+        data = calculate.make_eig_data(
+            self.evals, 'geigz', 'X001.log', diag_only=True)
+        full = np.diag(self.evals)
+        low_tri_idx = np.tril_indices_from(full)
+        self.assertEqual([d.val for d in data], full[low_tri_idx].tolist())
+        self.assertEqual([d.idx_1 for d in data],
+                         (low_tri_idx[0] + 1).tolist())
+        self.assertEqual([d.idx_2 for d in data],
+                         (low_tri_idx[1] + 1).tolist())
+    def test_full_matrix(self):
+        matrix = np.arange(16.).reshape(4, 4)
+        data = calculate.make_eig_data(matrix, 'mgeig', 'X001.mae')
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data[-1].val, 15.)
+    def test_collector_shapes(self):
+        # The full-matrix commands (ex. -mjeig) pass a 2D eigenmatrix, while
+        # -jeigz only passes its diagonal as a 1D array.
+        np.random.seed(0)
+        hess = np.random.rand(6, 6)
+        hess = hess + hess.T
+        evec = np.random.rand(6, 6)
+        full = calculate.make_eig_data(
+            np.dot(np.dot(evec, hess), evec.T), 'mjeig', 'X001.mae')
+        diag = calculate.make_eig_data(
+            (np.dot(evec, hess) * evec).sum(axis=1), 'jeigz', 'X001.in',
+            diag_only=True)
+        self.assertEqual(len(full), 21)
+        self.assertEqual(len(diag), 21)
+        for d, f in zip(diag, full):
+            self.assertEqual((d.idx_1, d.idx_2), (f.idx_1, f.idx_2))
+            if d.idx_1 == d.idx_2:
+                self.assertAlmostEqual(d.val, f.val)
+            else:
+                self.assertEqual(d.val, 0.)
+        with self.assertRaises(IndexError):
+            calculate.make_eig_data(
+                (np.dot(evec, hess) * evec).sum(axis=1), 'mjeig', 'X001.mae')
+
+class TestEigenmatrixCollectors(unittest.TestCase):
+    """
+    Check that each eigenmatrix command makes a data point for every element
+    in the lower triangle, using stand-ins for the files it reads.
+    """
+    def setUp(self):
+        np.random.seed(0)
+        hess = np.random.rand(6, 6)
+        self.hess = hess + hess.T
+        self.evec = np.random.rand(6, 6)
+        atoms = [SimpleNamespace(is_dummy=False, exact_mass=1., element='H')
+                 for i in range(2)]
+        self.struct = SimpleNamespace(
+            atoms=atoms, props={'total atoms': 2},
+            get_dummy_atom_indices=lambda: [])
+        self.inps = {
+            'X001.mae': SimpleNamespace(name_log='X001.q2mm.log'),
+            'X001.xyz': SimpleNamespace(name_hes='X001.hes')}
+        self.outs = {}
+        self.add_out('X001.mae', filetypes.Mae, structures=[self.struct])
+        self.add_out('X001.q2mm.log', filetypes.MacroModelLog,
+                     hessian=self.hess.copy())
+        self.add_out('X001.out', filetypes.JaguarOut,
+                     eigenvectors=self.evec.copy(), structures=[self.struct])
+        self.add_out('X001.log', filetypes.GaussLog, evecs=self.evec.copy())
+        self.add_out('X001.in', filetypes.JaguarIn,
+                     hessian=self.hess.copy(), structures=[self.struct])
+        self.add_out('X001.xyz', filetypes.TinkerXYZ,
+                     structures=[self.struct])
+        self.add_out('X001.hes', filetypes.TinkerHess,
+                     hessian=self.hess.copy())
+    def add_out(self, filename, classtype, **attrs):
+        key = (os.path.abspath(filename), classtype)
+        self.outs[key] = SimpleNamespace(filename=filename, **attrs)
+    def collect(self, function, com, filenames):
+        return function(
+            com, [[filenames]], self.inps, self.outs, '.', None, None)
+    def test_mjeig(self):
+        data = self.collect(calculate.collect_macromodel_jaguar_eigenmatrix,
+                            'mjeig', 'X001.mae,X001.out')
+        self.assertEqual(len(data), 21)
+    def test_mgeig(self):
+        data = self.collect(
+            calculate.collect_macromodel_gaussian_eigenmatrix,
+            'mgeig', 'X001.mae,X001.log')
+        self.assertEqual(len(data), 21)
+    def test_tgeig(self):
+        data = self.collect(calculate.collect_tinker_gaussian_eigenmatrix,
+                            'tgeig', 'X001.xyz,X001.log')
+        self.assertEqual(len(data), 21)
+    def test_jeigz(self):
+        data = self.collect(calculate.collect_jaguar_eigenmatrix,
+                            'jeigz', 'X001.in,X001.out')
+        self.assertEqual(len(data), 21)
+
+class TestLblToDataAttrs(unittest.TestCase):
+    """
+    Check that both indices are read from the labels of reference data.
+    """
+    def test_eig(self):
+        datum = calculate.datatypes.Datum()
+        calculate.lbl_to_data_attrs(datum, 'eig_X001.log_3-2')
+        self.assertEqual(datum.typ, 'eig')
+        self.assertEqual(datum.idx_1, 3)
+        self.assertEqual(datum.idx_2, 2)
+
+class TestCollectors(unittest.TestCase):
+    """
+    Check that data is still collected in the order collect_data used before
+    the commands were looked up in COLLECTORS.
+    """
+    def test_order(self):
+        self.assertEqual(list(calculate.COLLECTORS), [
+            'r', 'mp', 'je', 'ge1', 'ge1o', 'ge', 'me',
+            'gab', 'gaa', 'gat', 'gabo', 'gaao', 'gato', 'abo', 'aao', 'ato',
+            'ae1', 'ae1o', 'ah',
+            'jea', 'gea', 'mea', 'jeo', 'geo', 'meo', 'jeao', 'geao', 'meao',
+            'jb', 'gtb', 'gta', 'gtt', 'tb', 'ta', 'tt', 'tbo', 'tao', 'tto',
+            'te', 'tea', 'teo', 'teao', 'th', 'tgeig',
+            'mb', 'ja', 'ma', 'jt', 'mt', 'jq', 'mq', 'mgESP', 'mjESP',
+            'jqh', 'mqh', 'jqa', 'mqa', 'jh', 'gh', 'mh',
+            'jeigz', 'geigz', 'mjeig', 'mgeig'])
+
+class TestShiftEnergies(unittest.TestCase):
+    """
+    Check that groups of energies are made relative to the lowest energy or
+    to the average energy depending on the data type.
+    """
+    def shift(self, typ):
+        data = [calculate.datatypes.Datum(val=val, typ=typ)
+                for val in [3., 1., 8.]]
+        calculate.shift_energies(data, typ)
+        return [x.val for x in data]
+    def test_min(self):
+        for typ in ['e', 'eo']:
+            self.assertEqual(self.shift(typ), [2., 0., 7.])
+    def test_avg(self):
+        for typ in ['ea', 'eao']:
+            self.assertEqual(self.shift(typ), [-1., -3., 4.])
+    def test_other(self):
+        self.assertEqual(self.shift('b'), [3., 1., 8.])
+
 if __name__ == '__main__':
     logging.config.dictConfig(co.LOG_SETTINGS)
     unittest.main()
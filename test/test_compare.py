@@ -0,0 +1,148 @@
+from __future__ import print_function
+import logging
+import logging.config
+import math
+import numpy as np
+import unittest
+
+import compare
+import constants as co
+import datatypes
+
+logger = logging.getLogger(__name__)
+
+def make_data():
+    """
+    Small set of aligned reference and calculated data, keyed by data type
+    like `compare.data_by_type`. Covers torsions that wrap around 180, two
+    energy types, Hessian elements (weighted by the calculated data) and
+    eigenmatrix elements with their weights left to `compare.import_weights`.
+    """
+    # typ, idx_1, idx_2, reference value, calculated value, reference weight,
+    # calculated weight
+    rows = [
+        ('b', 1, None, 1.54, 1.51, 100., None),
+        ('b', 2, None, 1.09, 1.10, None, None),
+        ('b', 3, None, 1.43, 1.40, 0., None),
+        ('a', 1, None, 109.5, 112.0, 2., None),
+        ('t', 1, None, 175., -178., 1., None),
+        ('t', 2, None, -170., 160., 1., None),
+        ('t', 3, None, 60., 65., None, None),
+        ('e', 1, None, 0., 10.0, 3., None),
+        ('e', 1, None, 2.5, 14.0, 3., None),
+        ('e', 1, None, 4.0, 11.5, 0., None),
+        ('e', 2, None, 1.0, -3.0, None, None),
+        ('e', 2, None, 0.0, -6.5, None, None),
+        ('ea', 1, None, -0.5, 0.2, 1., None),
+        ('ea', 1, None, 0.5, 0.1, 1., None),
+        ('h', 1, 1, 0.52, 0.48, None, 0.031),
+        ('h', 1, 2, 0.01, -0.02, None, 0.),
+        ('eig', 1, 1, -0.3, -0.2, None, None),
+        ('eig', 2, 2, 900., 950., None, None),
+        ('eig', 3, 3, 3100., 3000., None, None),
+        ('eig', 2, 3, 5., 12., None, None),
+        ]
+    r_dict = {}
+    c_dict = {}
+    for i, (typ, idx_1, idx_2, r_val, c_val, r_wht, c_wht) in \
+            enumerate(rows):
+        lbl = '{}_{}'.format(typ, i)
+        r_dict.setdefault(typ, []).append(datatypes.Datum(
+                lbl=lbl, val=r_val, wht=r_wht, typ=typ,
+                idx_1=idx_1, idx_2=idx_2))
+        c_dict.setdefault(typ, []).append(datatypes.Datum(
+                lbl=lbl, val=c_val, wht=c_wht, typ=typ,
+                idx_1=idx_1, idx_2=idx_2))
+    # Same containers calculate hands to compare.
+    r_dict = {k: np.array(v, dtype=object) for k, v in r_dict.items()}
+    c_dict = {k: np.array(v, dtype=object) for k, v in c_dict.items()}
+    return r_dict, c_dict
+
+def old_scores(r_dict, c_dict):
+    """
+    Scores every data point one at a time, the way `compare.compare_data`
+    did before it used `compare.score_type`.
+    """
+    scores = {}
+    total_num_energy = sum(
+        len(r_dict[typ]) for typ in r_dict if typ in ['e','eo','ea','eao'])
+    for typ in sorted(r_dict):
+        if typ in ['e','eo','ea','eao']:
+            compare.correlate_energies(r_dict[typ], c_dict[typ])
+        compare.import_weights(r_dict[typ])
+        scores[typ] = []
+        for r, c in zip(r_dict[typ], c_dict[typ]):
+            if c.typ == 't':
+                diff = abs(r.val - c.val)
+                if diff > 180.:
+                    diff = 360. - diff
+            else:
+                diff = r.val - c.val
+            if typ in ['e', 'eo', 'ea', 'eao']:
+                score = (r.wht**2 * diff**2)/total_num_energy
+            elif typ == "h":
+                score = (c.wht**2 * diff**2)/len(c_dict[typ])
+            else:
+                score = (r.wht**2 * diff**2)/len(r_dict[typ])
+            scores[typ].append(score)
+    return scores
+
+class TestCompareData(unittest.TestCase):
+    """
+    Check that scoring a whole data type at once gives the same scores as
+    scoring one data point at a time.
+    """
+    def setUp(self):
+        self.expected = old_scores(*make_data())
+        self.r_dict, self.c_dict = make_data()
+    def test_score_type(self):
+        compare.compare_data(self.r_dict, self.c_dict)
+        # compare_data has already correlated the energies and imported the
+        # weights.
+        for typ in self.r_dict:
+            scores = compare.score_type(
+                self.r_dict[typ], self.c_dict[typ], typ, 7)
+            self.assertEqual(len(scores), len(self.expected[typ]))
+            for score, expected in zip(scores, self.expected[typ]):
+                self.assertAlmostEqual(score, expected, places=10)
+    def test_total(self):
+        expected = sum(sum(v) for v in self.expected.values())
+        self.assertAlmostEqual(
+            compare.compare_data(self.r_dict, self.c_dict), expected,
+            places=8)
+    def test_torsion_wraps(self):
+        compare.import_weights(self.r_dict['t'])
+        scores = compare.score_type(self.r_dict['t'], self.c_dict['t'], 't', 0)
+        # 175 and -178 are 7 degrees apart, -170 and 160 are 30.
+        self.assertAlmostEqual(scores[0], 7.**2 / 3)
+        self.assertAlmostEqual(scores[1], 30.**2 / 3)
+    def test_zero_weights(self):
+        compare.compare_data(self.r_dict, self.c_dict)
+        self.assertEqual(compare.score_type(
+                self.r_dict['b'], self.c_dict['b'], 'b', 7)[2], 0.)
+        self.assertEqual(compare.score_type(
+                self.r_dict['e'], self.c_dict['e'], 'e', 7)[2], 0.)
+        self.assertEqual(compare.score_type(
+                self.r_dict['h'], self.c_dict['h'], 'h', 7)[1], 0.)
+    def test_nan_weights(self):
+        r_dict, c_dict = make_data()
+        r_dict['e'][1].wht = float('nan')
+        c_dict['h'][0].wht = float('nan')
+        expected = old_scores(r_dict, c_dict)
+        r_dict, c_dict = make_data()
+        r_dict['e'][1].wht = float('nan')
+        c_dict['h'][0].wht = float('nan')
+        self.assertTrue(math.isnan(compare.compare_data(r_dict, c_dict)))
+        for typ in ['e', 'h']:
+            scores = compare.score_type(r_dict[typ], c_dict[typ], typ, 7)
+            for score, expected_score in zip(scores, expected[typ]):
+                if math.isnan(expected_score):
+                    self.assertTrue(math.isnan(score))
+                else:
+                    self.assertAlmostEqual(score, expected_score, places=10)
+        self.assertTrue(math.isnan(expected['e'][1]))
+        self.assertTrue(math.isnan(expected['h'][0]))
+
+if __name__ == '__main__':
+    logging.config.dictConfig(co.LOG_SETTINGS)
+    unittest.main()
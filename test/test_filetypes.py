@@ -0,0 +1,121 @@
+from __future__ import print_function
+import logging
+import logging.config
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import constants as co
+import filetypes
+
+logger = logging.getLogger(__name__)
+
+class TestCache(unittest.TestCase):
+    """
+    Check that cached arrays are only loaded when the cache is complete, up
+    to date and was written by the same code.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'X001.log')
+        with open(self.path, 'w') as f:
+            f.write('X001\n')
+        self.evals = np.array([1., 2., 3.])
+        filetypes.save_cache(self.path, evals=self.evals)
+        self.path_cache = filetypes.cache_path(self.path)
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    def test_hit(self):
+        cached = filetypes.load_cache(self.path, ['evals'])
+        self.assertEqual(cached['evals'].tolist(), self.evals.tolist())
+    def test_no_cache(self):
+        os.remove(self.path_cache)
+        self.assertIsNone(filetypes.load_cache(self.path, ['evals']))
+    def test_file_newer(self):
+        mtime = os.path.getmtime(self.path_cache)
+        os.utime(self.path, (mtime + 10, mtime + 10))
+        self.assertIsNone(filetypes.load_cache(self.path, ['evals']))
+    def test_missing_array(self):
+        self.assertIsNone(filetypes.load_cache(self.path, ['evals', 'evecs']))
+    def test_source_changed(self):
+        source_hash = filetypes.CACHE_SOURCE_HASH
+        filetypes.CACHE_SOURCE_HASH = 'changed'
+        try:
+            self.assertIsNone(filetypes.load_cache(self.path, ['evals']))
+        finally:
+            filetypes.CACHE_SOURCE_HASH = source_hash
+    def test_truncated(self):
+        with open(self.path_cache, 'rb') as f:
+            contents = f.read()
+        with open(self.path_cache, 'wb') as f:
+            f.write(contents[:len(contents) // 2])
+        self.assertIsNone(filetypes.load_cache(self.path, ['evals']))
+    def test_corrupt(self):
+        with open(self.path_cache, 'wb') as f:
+            f.write(b'PK\x03\x04 not a zip file')
+        self.assertIsNone(filetypes.load_cache(self.path, ['evals']))
+    def test_empty(self):
+        open(self.path_cache, 'wb').close()
+        self.assertIsNone(filetypes.load_cache(self.path, ['evals']))
+
+class TestMacroModelTokens(unittest.TestCase):
+    """
+    Check that MacroModel jobs started at the same time don't all count the
+    same free Schrodinger tokens.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.check_output = filetypes.sp.check_output
+        # Enough tokens for 2 jobs on top of the minimum.
+        self.tokens = co.MIN_SUITE_TOKENS + 2
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        filetypes.sp.check_output = self.fake_check_output
+    def tearDown(self):
+        filetypes.sp.check_output = self.check_output
+        shutil.rmtree(self.directory)
+    def fake_check_output(self, command, shell=False, cwd=None):
+        if 'licutil' in command:
+            # The license server doesn't see a job's tokens as taken until
+            # it's been running for a while, so report them all as free.
+            return (
+                'SUITE_26NOV2012 {0} of {1} tokens available\n'
+                'MMOD_MACROMODEL {0} of {1} tokens available\n'.format(
+                    self.tokens, self.tokens)).encode('utf-8')
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        return b''
+    def test_jobs_in_flight(self):
+        maes = [filetypes.Mae(os.path.join(self.directory, 'X{}.mae'.format(i)))
+                for i in range(4)]
+        threads = [threading.Thread(
+                target=mae.run, kwargs={'timeout': 0.01, 'max_timeout': 100})
+                   for mae in maes]
+        for thread in threads:
+            thread.start()
+        # Give every job the chance to get past the token check.
+        for _ in range(100):
+            with self.lock:
+                if self.running >= 2:
+                    break
+            time.sleep(0.01)
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(filetypes.MACROMODEL_JOBS, 0)
+
+if __name__ == '__main__':
+    logging.config.dictConfig(co.LOG_SETTINGS)
+    unittest.main()
@@ -0,0 +1,118 @@
+from __future__ import print_function
+import logging
+import logging.config
+import os
+import shutil
+import tempfile
+import unittest
+
+import constants as co
+import loop
+
+logger = logging.getLogger(__name__)
+
+class TestRefDataCache(unittest.TestCase):
+    """
+    Check that reference data saved by an earlier run is only reused when
+    none of the files or code it was calculated from have changed.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path_ref = os.path.join(self.directory, 'ref.txt')
+        with open(self.path_ref, 'w') as f:
+            f.write('b_X001_1_1-2 1.0 1.54\n')
+            f.write('b_X001_1_2-3 1.0 1.09\n')
+        self.path_mae = os.path.join(self.directory, 'X001.mae')
+        with open(self.path_mae, 'w') as f:
+            f.write('X001\n')
+        self.path_ff = os.path.join(self.directory, 'mm3.fld')
+        with open(self.path_ff, 'w') as f:
+            f.write('mm3\n')
+        self.args_ref = ['-d', self.directory, '-r', 'ref.txt']
+        self.args_backend = ['-d', self.directory, '-jb', 'X001.mae']
+        loop.REF_DATA_CACHE.clear()
+    def tearDown(self):
+        loop.REF_DATA_CACHE.clear()
+        shutil.rmtree(self.directory)
+    def touch(self, path, delta):
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + delta))
+    def test_same_key(self):
+        self.assertEqual(
+            loop.ref_data_key(self.args_ref), loop.ref_data_key(self.args_ref))
+    def test_input_mtime(self):
+        key = loop.ref_data_key(self.args_ref)
+        self.touch(self.path_ref, 10)
+        self.assertNotEqual(key, loop.ref_data_key(self.args_ref))
+    def test_input_size(self):
+        key = loop.ref_data_key(self.args_ref)
+        mtime = os.stat(self.path_ref).st_mtime
+        with open(self.path_ref, 'a') as f:
+            f.write('b_X001_1_3-4 1.0 1.43\n')
+        os.utime(self.path_ref, (mtime, mtime))
+        self.assertNotEqual(key, loop.ref_data_key(self.args_ref))
+    def test_ff_backend(self):
+        key = loop.ref_data_key(self.args_backend, ff_path=self.path_ff)
+        self.assertIn(self.path_ff, key[1])
+        self.touch(self.path_ff, 10)
+        self.assertNotEqual(
+            key, loop.ref_data_key(self.args_backend, ff_path=self.path_ff))
+    def test_ff_unknown(self):
+        # Without the FF, the key can't be used for data saved to the disk.
+        key = loop.ref_data_key(self.args_backend)
+        self.assertIn(None, key[2])
+    def test_ff_no_backend(self):
+        # Reading a reference file doesn't use the FF.
+        key = loop.ref_data_key(self.args_ref, ff_path=self.path_ff)
+        self.assertNotIn(self.path_ff, key[1])
+        self.touch(self.path_ff, 10)
+        self.assertEqual(
+            key, loop.ref_data_key(self.args_ref, ff_path=self.path_ff))
+    def test_source_changed(self):
+        key = loop.ref_data_key(self.args_ref)
+        source_hash = loop.SOURCE_HASH
+        loop.SOURCE_HASH = 'changed'
+        try:
+            new_key = loop.ref_data_key(self.args_ref)
+        finally:
+            loop.SOURCE_HASH = source_hash
+        self.assertNotEqual(key, new_key)
+        self.assertNotEqual(
+            loop.ref_data_cache_path(self.args_ref, key),
+            loop.ref_data_cache_path(self.args_ref, new_key))
+    def test_saved(self):
+        ref_data = loop.return_ref_data(self.args_ref)
+        key = loop.ref_data_key(self.args_ref)
+        path_cache = loop.ref_data_cache_path(self.args_ref, key)
+        self.assertEqual(
+            [x.val for x in loop.load_ref_data(path_cache)],
+            [x.val for x in ref_data])
+    def test_corrupt(self):
+        key = loop.ref_data_key(self.args_ref)
+        path_cache = loop.ref_data_cache_path(self.args_ref, key)
+        os.makedirs(os.path.dirname(path_cache))
+        with open(path_cache, 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertIsNone(loop.load_ref_data(path_cache))
+        # The reference data is calculated again instead.
+        ref_data = loop.return_ref_data(self.args_ref)
+        self.assertEqual([x.val for x in ref_data], [1.54, 1.09])
+    def test_truncated(self):
+        loop.return_ref_data(self.args_ref)
+        key = loop.ref_data_key(self.args_ref)
+        path_cache = loop.ref_data_cache_path(self.args_ref, key)
+        with open(path_cache, 'rb') as f:
+            contents = f.read()
+        with open(path_cache, 'wb') as f:
+            f.write(contents[:len(contents) // 2])
+        self.assertIsNone(loop.load_ref_data(path_cache))
+    def test_empty(self):
+        loop.return_ref_data(self.args_ref)
+        key = loop.ref_data_key(self.args_ref)
+        path_cache = loop.ref_data_cache_path(self.args_ref, key)
+        open(path_cache, 'wb').close()
+        self.assertIsNone(loop.load_ref_data(path_cache))
+
+if __name__ == '__main__':
+    logging.config.dictConfig(co.LOG_SETTINGS)
+    unittest.main()